@@ -0,0 +1,247 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, List
+
+from fastapi import HTTPException
+
+from metrics import registry
+
+# Задержка вызовов upstream по circuit breaker'у (users:entity, ...) и исходу
+UPSTREAM_LATENCY = registry.histogram(
+    "gateway_upstream_request_duration_seconds",
+    "Upstream call latency per circuit",
+    ("circuit", "outcome"),
+)
+
+
+# Circuit Breaker configuration
+class CircuitBreakerConfig:
+    def __init__(self):
+        # Скользящее окно: последние window_size вызовов, но не старше window_duration
+        self.window_size = int(os.getenv("CIRCUIT_WINDOW_SIZE", 20))
+        self.window_duration = float(os.getenv("CIRCUIT_WINDOW_DURATION", 60.0))
+        self.minimum_calls = int(os.getenv("CIRCUIT_MINIMUM_CALLS", 5))
+        self.failure_rate_threshold = float(os.getenv("CIRCUIT_FAILURE_RATE_THRESHOLD", 0.5))
+        self.slow_call_duration = float(os.getenv("CIRCUIT_SLOW_CALL_DURATION", 1.0))
+        self.slow_call_rate_threshold = float(os.getenv("CIRCUIT_SLOW_CALL_RATE_THRESHOLD", 0.8))
+        self.timeout_duration = float(os.getenv("CIRCUIT_OPEN_DURATION", 30.0))
+        self.half_open_max_probes = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", 3))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker со скользящим окном
+
+    CLOSED    - вызовы проходят; при превышении доли ошибок или медленных
+                вызовов в окне (не меньше minimum_calls) -> OPEN
+    OPEN      - вызовы отклоняются с 503 до истечения timeout_duration
+    HALF_OPEN - пропускается не больше half_open_max_probes пробных вызовов;
+                любая ошибка -> OPEN, все пробы успешны -> CLOSED
+
+    С общим состоянием воркеров (apply_peers) окна других воркеров
+    учитываются в доле ошибок, а OPEN в любом воркере открывает circuit
+    во всех до конца его timeout_duration. Вызовы других воркеров, сделанные
+    до последнего закрытия этого circuit, не учитываются.
+    """
+
+    def __init__(self, name: str, config: CircuitBreakerConfig):
+        self.name = name
+        self.config = config
+        self.state = "CLOSED"
+        self.opened_at = 0.0
+        self.opened_at_wall = 0.0
+        self.closed_at_wall = 0.0
+        # (время, ошибка, медленный) для каждого вызова в окне
+        self.window: deque = deque(maxlen=config.window_size)
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.rejected = 0
+        self.transitions: Dict[str, int] = {}
+        # Вызовы, ошибки и медленные вызовы в окнах других воркеров
+        self.peer_calls = 0
+        self.peer_failures = 0
+        self.peer_slow = 0
+
+    def _transition(self, state: str):
+        key = f"{self.state}->{state}"
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.state = state
+        if state == "OPEN":
+            self.opened_at = time.monotonic()
+            self.opened_at_wall = time.time()
+            print(f"🔴 {self.name} circuit breaker opened")
+        elif state == "HALF_OPEN":
+            self.probes_in_flight = 0
+            self.probe_successes = 0
+            print(f"🔄 {self.name} circuit breaker half-open")
+        else:
+            self.window.clear()
+            self.closed_at_wall = time.time()
+            self.peer_calls = self.peer_failures = self.peer_slow = 0
+            print(f"✅ {self.name} circuit breaker closed")
+
+    def _prune(self, now: float):
+        horizon = now - self.config.window_duration
+        while self.window and self.window[0][0] < horizon:
+            self.window.popleft()
+
+    def _counts(self) -> tuple:
+        """Вызовы, ошибки и медленные вызовы в окне этого воркера"""
+        self._prune(time.monotonic())
+        failures = sum(1 for _, failed, _ in self.window if failed)
+        slow = sum(1 for _, _, is_slow in self.window if is_slow)
+        return len(self.window), failures, slow
+
+    def rates(self) -> tuple:
+        """Доля ошибок и медленных вызовов в текущем окне (вместе с другими воркерами)"""
+        calls, failures, slow = self._counts()
+        calls += self.peer_calls
+        if not calls:
+            return 0.0, 0.0
+        return (failures + self.peer_failures) / calls, (slow + self.peer_slow) / calls
+
+    def try_acquire(self) -> bool:
+        """Можно ли выполнить вызов; в HALF_OPEN занимает слот пробы"""
+        if self.state == "OPEN":
+            if time.monotonic() - self.opened_at < self.config.timeout_duration:
+                return False
+            self._transition("HALF_OPEN")
+        if self.state == "HALF_OPEN":
+            if self.probes_in_flight >= self.config.half_open_max_probes:
+                return False
+            self.probes_in_flight += 1
+        return True
+
+    def record(self, failed: bool, duration: float, probe: bool):
+        slow = duration >= self.config.slow_call_duration
+        if probe:
+            self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            if self.state != "HALF_OPEN":
+                return
+            if failed or slow:
+                self._transition("OPEN")
+                return
+            self.probe_successes += 1
+            if self.probe_successes >= self.config.half_open_max_probes:
+                self._transition("CLOSED")
+            return
+
+        if self.state != "CLOSED":
+            return
+        now = time.monotonic()
+        self.window.append((now, failed, slow))
+        self._prune(now)
+        if len(self.window) + self.peer_calls < self.config.minimum_calls:
+            return
+        failure_rate, slow_rate = self.rates()
+        if failure_rate >= self.config.failure_rate_threshold or \
+           slow_rate >= self.config.slow_call_rate_threshold:
+            self._transition("OPEN")
+
+    async def call(self, func, *args, **kwargs):
+        if not self.try_acquire():
+            self.rejected += 1
+            UPSTREAM_LATENCY.labels(self.name, "rejected").observe(0.0)
+            raise HTTPException(
+                status_code=503,
+                detail=f"{self.name} service temporarily unavailable"
+            )
+
+        probe = self.state == "HALF_OPEN"
+        started = time.monotonic()
+        try:
+            result = await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            # Отмена клиентом не говорит о здоровье upstream
+            if probe:
+                self.probes_in_flight = max(0, self.probes_in_flight - 1)
+            raise
+        except Exception:
+            duration = time.monotonic() - started
+            self.record(True, duration, probe)
+            UPSTREAM_LATENCY.labels(self.name, "failure").observe(duration)
+            raise
+        duration = time.monotonic() - started
+        self.record(False, duration, probe)
+        UPSTREAM_LATENCY.labels(self.name, "success").observe(duration)
+        return result
+
+    def snapshot(self) -> dict:
+        """Состояние для других воркеров (окно - только пока CLOSED)"""
+        calls, failures, slow = self._counts() if self.state == "CLOSED" else (0, 0, 0)
+        # Время вызовов - по стенным часам, общим для воркеров
+        offset = time.time() - time.monotonic()
+        return {
+            "state": self.state,
+            "opened_at": self.opened_at_wall,
+            "calls": calls,
+            "failures": failures,
+            "slow": slow,
+            "window": [
+                [at + offset, failed, is_slow] for at, failed, is_slow in self.window
+            ] if self.state == "CLOSED" else [],
+            "rejected": self.rejected,
+        }
+
+    def apply_peers(self, peers: List[dict]):
+        """Учесть снимки этого circuit из других воркеров"""
+        now = time.time()
+        # Ошибки до восстановления этого circuit не должны открыть его снова
+        horizon = max(self.closed_at_wall, now - self.config.window_duration)
+        window = [call for peer in peers for call in peer.get("window", []) if call[0] >= horizon]
+        self.peer_calls = len(window)
+        self.peer_failures = sum(1 for _, failed, _ in window if failed)
+        self.peer_slow = sum(1 for _, _, is_slow in window if is_slow)
+        if self.state != "CLOSED":
+            return
+        opened_at = max(
+            (peer["opened_at"] for peer in peers
+             if peer["state"] == "OPEN" and now - peer["opened_at"] < self.config.timeout_duration),
+            default=None,
+        )
+        if opened_at is not None:
+            self._transition("OPEN")
+            # Открыт до того же момента, что и у открывшего воркера
+            self.opened_at -= now - opened_at
+            self.opened_at_wall = opened_at
+
+    def stats(self) -> dict:
+        failure_rate, slow_rate = self.rates()
+        return {
+            "status": self.state,
+            "calls_in_window": len(self.window) + self.peer_calls,
+            "failure_rate": round(failure_rate, 3),
+            "slow_call_rate": round(slow_rate, 3),
+            "half_open_probes_in_flight": self.probes_in_flight,
+            "rejected": self.rejected,
+            "transitions": dict(self.transitions),
+        }
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers по upstream и классу маршрута (users:entity, orders:write, ...)"""
+
+    def __init__(self, config: CircuitBreakerConfig):
+        self.config = config
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(name, self.config)
+        return breaker
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {name: breaker.snapshot() for name, breaker in self.breakers.items()}
+
+    def apply_peers(self, peer_snapshots: List[Dict[str, dict]]):
+        names = set(self.breakers).union(*peer_snapshots)
+        for name in names:
+            self.get(name).apply_peers(
+                [snapshot[name] for snapshot in peer_snapshots if name in snapshot]
+            )
+
+    def stats(self) -> dict:
+        return {name: breaker.stats() for name, breaker in self.breakers.items()}
@@ -0,0 +1,191 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Dict
+
+import httpx
+from fastapi import HTTPException
+
+
+# Adaptive concurrency limiter configuration
+class ConcurrencyLimiterConfig:
+    def __init__(self):
+        self.initial_limit = int(os.getenv("LIMITER_INITIAL_LIMIT", 20))
+        self.min_limit = int(os.getenv("LIMITER_MIN_LIMIT", 2))
+        self.max_limit = int(os.getenv("LIMITER_MAX_LIMIT", 200))
+        # Очереди ожидания по полосам приоритета (write обслуживается первой)
+        self.max_queue = {
+            "write": int(os.getenv("LIMITER_MAX_QUEUE_WRITE", 100)),
+            "read": int(os.getenv("LIMITER_MAX_QUEUE_READ", 50)),
+        }
+        self.queue_timeout = float(os.getenv("LIMITER_QUEUE_TIMEOUT", 1.0))
+        # AIMD: +1/limit на быстрый ответ, *backoff_ratio на медленный или ошибку
+        self.backoff_ratio = float(os.getenv("LIMITER_BACKOFF_RATIO", 0.9))
+        self.rtt_tolerance = float(os.getenv("LIMITER_RTT_TOLERANCE", 2.0))
+        self.min_latency_threshold = float(os.getenv("LIMITER_MIN_LATENCY_THRESHOLD", 0.05))
+
+
+LANES = ("write", "read")
+
+
+class ConcurrencyLimiter:
+    """
+    Адаптивный лимит одновременных вызовов upstream (AIMD по задержке)
+
+    Пока ответы не медленнее rtt_tolerance * базовой задержки, лимит
+    растёт на 1/limit за ответ; медленный ответ или ошибка уменьшают
+    его в backoff_ratio раз. Сверх лимита запросы ждут в ограниченной
+    очереди своей полосы, при переполнении или таймауте - 503.
+    """
+
+    def __init__(self, name: str, config: ConcurrencyLimiterConfig):
+        self.name = name
+        self.config = config
+        self.limit = float(config.initial_limit)
+        self.in_flight = 0
+        self.queues: Dict[str, deque] = {lane: deque() for lane in LANES}
+        self.shed: Dict[str, int] = {lane: 0 for lane in LANES}
+        # Базовая задержка (медленная EWMA по успешным ответам)
+        self.baseline_rtt = 0.0
+        self.last_decrease = 0.0
+
+    def _latency_threshold(self) -> float:
+        return max(self.config.min_latency_threshold, self.baseline_rtt * self.config.rtt_tolerance)
+
+    def _retry_after(self) -> int:
+        queued = sum(len(queue) for queue in self.queues.values())
+        estimate = (queued + 1) * max(self.baseline_rtt, self.config.min_latency_threshold) / self.limit
+        return max(1, math.ceil(estimate))
+
+    def _reject(self, lane: str, reason: str):
+        self.shed[lane] += 1
+        raise HTTPException(
+            status_code=503,
+            detail=f"{self.name} service overloaded ({reason})",
+            headers={"Retry-After": str(self._retry_after())},
+        )
+
+    async def acquire(self, lane: str):
+        # Свободный слот и никто из полос не старше по приоритету не ждёт
+        if self.in_flight < int(self.limit) and not any(
+            self.queues[other] for other in LANES[:LANES.index(lane) + 1]
+        ):
+            self.in_flight += 1
+            return
+
+        queue = self.queues[lane]
+        if len(queue) >= self.config.max_queue[lane]:
+            self._reject(lane, "queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            # Слот передаётся ожидающему в release() без уменьшения in_flight
+            await asyncio.wait_for(waiter, self.config.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(queue, waiter)
+            self._reject(lane, "queue timeout")
+        except asyncio.CancelledError:
+            self._discard(queue, waiter)
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    @staticmethod
+    def _discard(queue: deque, waiter: asyncio.Future):
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            pass
+
+    def release(self):
+        # Пока лимит позволяет, передаём слот следующему в порядке приоритета
+        if self.in_flight <= int(self.limit):
+            for lane in LANES:
+                queue = self.queues[lane]
+                while queue:
+                    waiter = queue.popleft()
+                    if not waiter.done():
+                        waiter.set_result(None)
+                        return
+        self.in_flight -= 1
+
+    def on_sample(self, rtt: float, failed: bool):
+        """Подстроить лимит по задержке и исходу вызова"""
+        if failed:
+            self._decrease()
+            return
+        if not self.baseline_rtt:
+            self.baseline_rtt = rtt
+        threshold = self._latency_threshold()
+        # Медленные ответы сдвигают базу не дальше порога, чтобы она не "уплывала" под перегрузкой
+        self.baseline_rtt = 0.95 * self.baseline_rtt + 0.05 * min(rtt, threshold)
+        if rtt > threshold:
+            self._decrease()
+        else:
+            self.limit = min(self.config.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self):
+        # Не чаще одного снижения за базовую задержку
+        now = time.monotonic()
+        if now - self.last_decrease >= self.baseline_rtt:
+            self.limit = max(self.config.min_limit, self.limit * self.config.backoff_ratio)
+            self.last_decrease = now
+
+    async def call(self, lane: str, func, *args, **kwargs):
+        await self.acquire(lane)
+        started = time.monotonic()
+        held = False
+        try:
+            result = await func(*args, **kwargs)
+        except HTTPException:
+            # Отказ circuit breaker'а - не замер задержки upstream
+            raise
+        except Exception:
+            self.on_sample(time.monotonic() - started, failed=True)
+            raise
+        else:
+            if isinstance(result, httpx.Response) and not result.is_closed:
+                self._release_on_close(result, started)
+                held = True
+            else:
+                self.on_sample(time.monotonic() - started, failed=False)
+            return result
+        finally:
+            if not held:
+                self.release()
+
+    def _release_on_close(self, response: httpx.Response, started: float):
+        """
+        Потоковый ответ держит слот до aclose(): передача тела - тоже работа upstream
+
+        Замер задержки - до закрытия; ответ, закрытый без чтения тела
+        (проигравший hedge), замером не считается.
+        """
+        close = response.aclose
+        released = False
+
+        async def aclose():
+            nonlocal released
+            try:
+                await close()
+            finally:
+                if not released:
+                    released = True
+                    if response.is_stream_consumed:
+                        self.on_sample(time.monotonic() - started, failed=False)
+                    self.release()
+
+        response.aclose = aclose
+
+    def stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": {lane: len(queue) for lane, queue in self.queues.items()},
+            "shed": dict(self.shed),
+            "baseline_rtt_ms": round(self.baseline_rtt * 1000, 3),
+            "latency_threshold_ms": round(self._latency_threshold() * 1000, 3),
+        }
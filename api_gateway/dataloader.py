@@ -0,0 +1,71 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+
+class DataLoader:
+    """
+    Сбор отдельных загрузок по ключу в пакетные вызовы
+
+    Все load(), сделанные в одном проходе event loop, объединяются в
+    batch_fn(keys) -> {key: value} (по max_batch_size ключей). Ключ,
+    которого нет в результате, загружается как None. Результаты
+    запоминаются, поэтому loader создаётся на один запрос клиента.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+        max_batch_size: int = 100,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.futures: Dict[Hashable, asyncio.Future] = {}
+        self.queue: List[Hashable] = []
+        # Ссылки на задачи пакетов, чтобы их не собрал GC до завершения
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = 0
+
+    def load(self, key: Hashable) -> Awaitable[Optional[Any]]:
+        future = self.futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self.futures[key] = loop.create_future()
+            if not self.queue:
+                loop.call_soon(self._dispatch)
+            self.queue.append(key)
+        return future
+
+    async def load_many(self, keys: List[Hashable]) -> List[Optional[Any]]:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        queue, self.queue = self.queue, []
+        for start in range(0, len(queue), self.max_batch_size):
+            task = asyncio.get_running_loop().create_task(
+                self._run(queue[start:start + self.max_batch_size])
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, keys: List[Hashable]):
+        self.batches += 1
+        try:
+            values = await self.batch_fn(keys)
+        except BaseException as e:
+            # Отмена пакета (shutdown, отключение клиента) не должна оставить
+            # ожидающих load() навсегда - они получают ошибку
+            error = e if isinstance(e, Exception) else RuntimeError(
+                f"batch load interrupted: {type(e).__name__}"
+            )
+            for key in keys:
+                # Ошибку получают ожидающие; повторный load() загрузит ключ заново
+                future = self.futures.pop(key)
+                if not future.done():
+                    future.set_exception(error)
+            if error is not e:
+                raise
+            return
+        for key in keys:
+            future = self.futures[key]
+            if not future.done():
+                future.set_result(values.get(key))
@@ -0,0 +1,95 @@
+import contextlib
+import importlib
+import os
+import sys
+from typing import Dict, Optional
+
+from http_client import EMBEDDED_SCHEME, embedded_apps, env_bool
+
+
+SERVICES = ("users", "orders", "payments")
+
+
+# Embedded single-process mode configuration
+class EmbeddedConfig:
+    def __init__(self):
+        self.enabled = env_bool("EMBEDDED_MODE")
+        # Каталог с service_users/, service_orders/, service_payments/
+        self.services_root = os.getenv(
+            "EMBEDDED_SERVICES_ROOT",
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        )
+        # SQLite базы сервисов (если не задан EMBEDDED_<SERVICE>_DATABASE_URL)
+        self.data_dir = os.getenv("EMBEDDED_DATA_DIR", "data")
+        # memory - кэш в памяти процесса, redis - общий Redis (REDIS_HOST)
+        self.cache_backend = os.getenv("EMBEDDED_CACHE_BACKEND", "memory")
+
+    def database_url(self, service: str) -> str:
+        return os.getenv(
+            f"EMBEDDED_{service.upper()}_DATABASE_URL",
+            f"sqlite:///{os.path.join(self.data_dir, service)}.db"
+        )
+
+
+@contextlib.contextmanager
+def _environ(overrides: Dict[str, str]):
+    """Временно подменить переменные окружения (сервисы читают их при импорте)"""
+    saved = {name: os.environ.get(name) for name in overrides}
+    os.environ.update(overrides)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+class EmbeddedServices:
+    """
+    Встроенный режим: users, orders и payments работают в процессе gateway
+
+    Приложения сервисов импортируются как service_<name>.app.main и
+    вызываются через ASGI transport (адрес embedded://<name>), поэтому
+    маршрутизация, circuit breakers и лимиты остаются прежними, а сетевых
+    переходов между уровнями нет. Каждый сервис получает свою БД.
+    """
+
+    def __init__(self, config: EmbeddedConfig):
+        self.config = config
+        self._stack: Optional[contextlib.AsyncExitStack] = None
+
+    def load(self):
+        if not self.config.enabled:
+            return
+        if self.config.services_root not in sys.path:
+            sys.path.insert(0, self.config.services_root)
+        os.makedirs(self.config.data_dir, exist_ok=True)
+        trace_file = os.getenv("TRACE_FILE", "")
+        for service in SERVICES:
+            overrides = {
+                "DATABASE_URL": self.config.database_url(service),
+                "CACHE_BACKEND": self.config.cache_backend,
+            }
+            if trace_file:
+                overrides["TRACE_FILE"] = f"{trace_file}.{service}"
+            with _environ(overrides):
+                module = importlib.import_module(f"service_{service}.app.main")
+            embedded_apps[service] = module.app
+        print(f"📦 Embedded mode: {', '.join(SERVICES)} running in-process")
+
+    def url(self, service: str, default: str) -> str:
+        """Адрес сервиса по умолчанию с учётом встроенного режима"""
+        return f"{EMBEDDED_SCHEME}{service}" if self.config.enabled else default
+
+    async def start(self):
+        """Выполнить lifespan сервисов (создание таблиц и т.д.)"""
+        self._stack = contextlib.AsyncExitStack()
+        for service, app in embedded_apps.items():
+            await self._stack.enter_async_context(app.router.lifespan_context(app))
+
+    async def close(self):
+        if self._stack is not None:
+            await self._stack.aclose()
+            self._stack = None
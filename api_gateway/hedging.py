@@ -0,0 +1,238 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Type
+
+from http_client import env_bool
+
+
+# Hedging / retry configuration для идемпотентных вызовов
+class HedgingConfig:
+    def __init__(self):
+        self.hedge_enabled = env_bool("HEDGE_ENABLED", "true")
+        self.hedge_min_delay = float(os.getenv("HEDGE_MIN_DELAY", 0.01))
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", 0.95))
+        self.max_retries = int(os.getenv("RETRY_MAX_ATTEMPTS", 2))
+        self.backoff_base = float(os.getenv("RETRY_BACKOFF_BASE", 0.05))
+        self.backoff_max = float(os.getenv("RETRY_BACKOFF_MAX", 0.5))
+        # Бюджет: каждый запрос добавляет budget_ratio токена, повтор/хедж тратит 1
+        self.budget_ratio = float(os.getenv("RETRY_BUDGET_RATIO", 0.1))
+        self.budget_max_tokens = float(os.getenv("RETRY_BUDGET_MAX_TOKENS", 10))
+        # Таймаут = p99 * timeout_multiplier в пределах [min_timeout, max_timeout]
+        self.timeout_multiplier = float(os.getenv("TIMEOUT_P99_MULTIPLIER", 3.0))
+        self.min_timeout = float(os.getenv("TIMEOUT_MIN", 0.5))
+        self.max_timeout = float(os.getenv("TIMEOUT_MAX", 3.0))
+        self.min_samples = int(os.getenv("LATENCY_MIN_SAMPLES", 20))
+        self.window_size = int(os.getenv("LATENCY_WINDOW_SIZE", 1000))
+
+
+class LatencyTracker:
+    """Перцентили задержки по последним window_size вызовам (успешным и по таймауту)"""
+
+    def __init__(self, window_size: int):
+        self.samples: deque = deque(maxlen=window_size)
+        self._sorted: Optional[list] = None
+        self._since_sort = 0
+
+    def record(self, seconds: float):
+        self.samples.append(seconds)
+        self._since_sort += 1
+        # Пересортировка не чаще раза в 32 замера - дешёвый hot path
+        if self._since_sort >= 32:
+            self._sorted = None
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+            self._since_sort = 0
+        index = min(len(self._sorted) - 1, int(q * len(self._sorted)))
+        return self._sorted[index]
+
+
+class RetryBudget:
+    """Token bucket: повторы и хеджи не больше budget_ratio от числа запросов"""
+
+    def __init__(self, ratio: float, max_tokens: float):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.exhausted = 0
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.exhausted += 1
+        return False
+
+
+class HedgedCaller:
+    """
+    Идемпотентные вызовы upstream: адаптивный таймаут, hedging и повторы
+
+    1. Таймаут вызова считается по p99 живой задержки
+    2. Если ответа нет дольше p95 (hedge_percentile) - отправляется второй (hedge) запрос,
+       используется первый успешный ответ
+    3. Сетевые ошибки и 5xx повторяются с jittered backoff, но все попытки
+       вместе укладываются в один дедлайн max_timeout
+    Задержка учитывается отдельно по классу маршрута (entity, list): быстрые
+    чтения по id из кэша upstream не должны задавать таймаут спискам.
+    Hedge и повторы тратят токены общего бюджета upstream.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        config: HedgingConfig,
+        retryable: Tuple[Type[BaseException], ...],
+        timeouts: Tuple[Type[BaseException], ...] = (asyncio.TimeoutError,),
+    ):
+        self.name = name
+        self.config = config
+        self.retryable = retryable
+        self.timeouts = timeouts
+        self.latency: Dict[str, LatencyTracker] = {}
+        self.budget = RetryBudget(config.budget_ratio, config.budget_max_tokens)
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.retries = 0
+
+    def tracker(self, route_class: str) -> LatencyTracker:
+        tracker = self.latency.get(route_class)
+        if tracker is None:
+            tracker = self.latency[route_class] = LatencyTracker(self.config.window_size)
+        return tracker
+
+    def _warm(self, route_class: str) -> bool:
+        return len(self.tracker(route_class).samples) >= self.config.min_samples
+
+    def timeout(self, route_class: str) -> float:
+        if not self._warm(route_class):
+            return self.config.max_timeout
+        timeout = self.tracker(route_class).percentile(0.99) * self.config.timeout_multiplier
+        return min(self.config.max_timeout, max(self.config.min_timeout, timeout))
+
+    def hedge_delay(self, route_class: str) -> Optional[float]:
+        if not self.config.hedge_enabled or not self._warm(route_class):
+            return None
+        return max(
+            self.config.hedge_min_delay,
+            self.tracker(route_class).percentile(self.config.hedge_percentile),
+        )
+
+    async def call(
+        self,
+        attempt: Callable[[float], Awaitable[Any]],
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+        route_class: str = "entity",
+    ) -> Any:
+        """
+        attempt(timeout) - один вызов upstream;
+        discard(result) - освободить лишний успешный результат (например, закрыть поток);
+        route_class - чья статистика задержки задаёт таймаут и задержку hedge
+        """
+        self.budget.deposit()
+        deadline = time.monotonic() + self.config.max_timeout
+        retries = 0
+        while True:
+            try:
+                return await self._hedged(attempt, discard, route_class, deadline)
+            except self.retryable:
+                if retries >= self.config.max_retries:
+                    raise
+                # Full jitter backoff; повтор без времени до дедлайна бесполезен
+                backoff = min(self.config.backoff_max, self.config.backoff_base * 2 ** (retries + 1))
+                pause = random.uniform(0, backoff)
+                if deadline - time.monotonic() - pause < self.config.hedge_min_delay:
+                    raise
+                if not self.budget.withdraw():
+                    raise
+                retries += 1
+                self.retries += 1
+                await asyncio.sleep(pause)
+
+    async def _timed(self, attempt, timeout: float, tracker: LatencyTracker, adaptive: float):
+        started = time.monotonic()
+        try:
+            result = await attempt(timeout)
+        except self.timeouts:
+            # Истёкший таймаут - тоже замер (не меньше таймаута), иначе окно
+            # видит только быстрые ответы и таймаут не может вырасти;
+            # таймаут, урезанный дедлайном вызова, о задержке ничего не говорит
+            if timeout >= adaptive:
+                tracker.record(max(timeout, time.monotonic() - started))
+            raise
+        tracker.record(time.monotonic() - started)
+        return result
+
+    def _discard_later(self, task: asyncio.Task, discard):
+        def on_done(t: asyncio.Task):
+            if discard is not None and not t.cancelled() and t.exception() is None:
+                asyncio.ensure_future(discard(t.result()))
+            elif not t.cancelled():
+                t.exception()
+        task.add_done_callback(on_done)
+
+    async def _hedged(self, attempt, discard, route_class: str, deadline: float):
+        tracker = self.tracker(route_class)
+        adaptive = self.timeout(route_class)
+        timeout = min(adaptive, deadline - time.monotonic())
+        tasks = [asyncio.ensure_future(self._timed(attempt, timeout, tracker, adaptive))]
+        try:
+            hedge_delay = self.hedge_delay(route_class)
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done and self.budget.withdraw():
+                    self.hedges += 1
+                    hedge_timeout = min(timeout, deadline - time.monotonic())
+                    tasks.append(asyncio.ensure_future(
+                        self._timed(attempt, hedge_timeout, tracker, adaptive)
+                    ))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in tasks if t in done and t.exception() is None), None)
+                if winner is not None:
+                    if winner is not tasks[0]:
+                        self.hedge_wins += 1
+                    for t in done:
+                        if t is not winner:
+                            self._discard_later(t, discard)
+                    return winner.result()
+                error = next(t for t in tasks if t in done).exception()
+            raise error
+        finally:
+            for t in tasks:
+                if not t.done():
+                    t.cancel()
+                    self._discard_later(t, discard)
+
+    def stats(self) -> dict:
+        to_ms = lambda v: round(v * 1000, 3) if v is not None else None
+        latency = {}
+        for route_class, tracker in self.latency.items():
+            p50, p95, p99 = (tracker.percentile(q) for q in (0.5, 0.95, 0.99))
+            latency[route_class] = {
+                "latency_p50_ms": to_ms(p50),
+                "latency_p95_ms": to_ms(p95),
+                "latency_p99_ms": to_ms(p99),
+                "timeout_ms": to_ms(self.timeout(route_class)),
+                "hedge_delay_ms": to_ms(self.hedge_delay(route_class)),
+            }
+        return {
+            "latency": latency,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "retries": self.retries,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "retry_budget_exhausted": self.budget.exhausted,
+        }
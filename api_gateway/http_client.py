@@ -0,0 +1,361 @@
+import asyncio
+import bisect
+import hashlib
+import os
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from tracing import tracer
+
+
+def env_bool(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes", "on")
+
+
+# Upstream HTTP client configuration
+class UpstreamClientConfig:
+    def __init__(self):
+        self.max_connections = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", 100))
+        self.max_keepalive_connections = int(os.getenv("UPSTREAM_MAX_KEEPALIVE_CONNECTIONS", 20))
+        self.keepalive_expiry = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", 30.0))
+        self.pool_timeout = float(os.getenv("UPSTREAM_POOL_TIMEOUT", 1.0))
+        self.request_timeout = float(os.getenv("UPSTREAM_REQUEST_TIMEOUT", 3.0))
+        self.http2 = env_bool("UPSTREAM_HTTP2")
+        self.prewarm_connections = int(os.getenv("UPSTREAM_PREWARM_CONNECTIONS", 2))
+        self.prewarm_path = os.getenv("UPSTREAM_PREWARM_PATH", "/health")
+        # Балансировка: consistent_hash (по ключу сущности) или least_outstanding
+        self.lb_strategy = os.getenv("UPSTREAM_LB_STRATEGY", "consistent_hash")
+        self.hash_ring_vnodes = int(os.getenv("UPSTREAM_HASH_RING_VNODES", 100))
+        # Активные проверки здоровья
+        self.health_check_path = os.getenv("UPSTREAM_HEALTH_CHECK_PATH", "/health")
+        self.health_check_interval = float(os.getenv("UPSTREAM_HEALTH_CHECK_INTERVAL", 5.0))
+        self.health_check_timeout = float(os.getenv("UPSTREAM_HEALTH_CHECK_TIMEOUT", 1.0))
+        self.unhealthy_threshold = int(os.getenv("UPSTREAM_UNHEALTHY_THRESHOLD", 2))
+        # Пассивное исключение после серии ошибок
+        self.eject_after_failures = int(os.getenv("UPSTREAM_EJECT_AFTER_FAILURES", 5))
+        self.eject_duration = float(os.getenv("UPSTREAM_EJECT_DURATION", 30.0))
+
+
+# Встроенный режим: embedded://users - приложение сервиса в том же процессе
+# (вызывается через ASGI transport, без сети). Заполняется модулем embedded.
+EMBEDDED_SCHEME = "embedded://"
+embedded_apps: Dict[str, Any] = {}
+
+
+# Оставшийся бюджет запроса в мс (относительный - не зависит от часов сервисов)
+DEADLINE_HEADER = "x-request-timeout-ms"
+
+
+# События httpcore, означающие, что соединение из пула уже получено
+_CONNECTION_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+class UpstreamInstance:
+    """Один экземпляр upstream сервиса: свой пул соединений и состояние здоровья"""
+
+    def __init__(self, base_url: str, config: UpstreamClientConfig):
+        self.base_url = base_url
+        self.config = config
+        self.client: Optional[httpx.AsyncClient] = None
+        self.http2_enabled = False
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests_total = 0
+        self.failures_total = 0
+        self.connections_opened = 0
+        self.pool_wait_total = 0.0
+        self.pool_wait_max = 0.0
+        self.healthy = True
+        self.health_check_failures = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    @property
+    def embedded(self) -> bool:
+        return self.base_url.startswith(EMBEDDED_SCHEME)
+
+    def _build_client(self, http2: bool) -> httpx.AsyncClient:
+        if self.embedded:
+            name = self.base_url[len(EMBEDDED_SCHEME):]
+            return httpx.AsyncClient(
+                base_url=f"http://{name}",
+                transport=httpx.ASGITransport(app=embedded_apps[name]),
+                timeout=httpx.Timeout(self.config.request_timeout),
+            )
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=self.config.max_connections,
+                max_keepalive_connections=self.config.max_keepalive_connections,
+                keepalive_expiry=self.config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                self.config.request_timeout,
+                pool=self.config.pool_timeout,
+            ),
+        )
+
+    def start(self):
+        try:
+            self.client = self._build_client(self.config.http2)
+            self.http2_enabled = self.config.http2 and not self.embedded
+        except ImportError:
+            # HTTP/2 требует пакет h2 (httpx[http2])
+            print(f"⚠️  {self.base_url}: h2 not installed - falling back to HTTP/1.1")
+            self.client = self._build_client(False)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def record_success(self):
+        self.consecutive_failures = 0
+
+    def record_failure(self):
+        self.failures_total += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.config.eject_after_failures:
+            self.consecutive_failures = 0
+            self.ejected_until = time.monotonic() + self.config.eject_duration
+            self.ejections += 1
+            print(f"⛔ {self.base_url} ejected for {self.config.eject_duration}s")
+
+    async def check_health(self):
+        try:
+            response = await self.client.get(
+                self.config.health_check_path,
+                timeout=self.config.health_check_timeout,
+            )
+            ok = response.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        if ok:
+            if not self.healthy:
+                print(f"💚 {self.base_url} is healthy again")
+            self.healthy = True
+            self.health_check_failures = 0
+        else:
+            self.health_check_failures += 1
+            if self.healthy and self.health_check_failures >= self.config.unhealthy_threshold:
+                self.healthy = False
+                print(f"💔 {self.base_url} marked unhealthy")
+
+    async def send(self, method: str, url: str, stream: bool, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        acquired = False
+
+        async def trace(event_name: str, info: dict):
+            nonlocal acquired
+            if event_name == "connection.connect_tcp.started":
+                self.connections_opened += 1
+            if not acquired and event_name in _CONNECTION_ACQUIRED_EVENTS:
+                acquired = True
+                waited = time.perf_counter() - started
+                self.pool_wait_total += waited
+                self.pool_wait_max = max(self.pool_wait_max, waited)
+
+        self.in_flight += 1
+        self.requests_total += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            request = self.client.build_request(
+                method, url, extensions={"trace": trace}, **kwargs
+            )
+            response = await self.client.send(request, stream=stream)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        if not stream:
+            self.in_flight -= 1
+            return response
+
+        # Потоковый ответ занимает соединение до aclose(), а не до заголовков
+        close = response.aclose
+        released = False
+
+        async def aclose():
+            nonlocal released
+            try:
+                await close()
+            finally:
+                if not released:
+                    released = True
+                    self.in_flight -= 1
+
+        response.aclose = aclose
+        return response
+
+    def stats(self) -> dict:
+        avg_wait = self.pool_wait_total / self.requests_total if self.requests_total else 0.0
+        return {
+            "healthy": self.healthy,
+            "ejected": time.monotonic() < self.ejected_until,
+            "ejections": self.ejections,
+            "http2": self.http2_enabled,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "utilization": round(self.in_flight / self.config.max_connections, 3),
+            "requests_total": self.requests_total,
+            "failures_total": self.failures_total,
+            "connections_opened": self.connections_opened,
+            "pool_wait_avg_ms": round(avg_wait * 1000, 3),
+            "pool_wait_max_ms": round(self.pool_wait_max * 1000, 3),
+        }
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class UpstreamClient:
+    """
+    Пул экземпляров одного upstream сервиса
+
+    base_urls - один URL или несколько через запятую. Запросы с ключом
+    сущности (affinity_key) идут на экземпляр по consistent hashing, чтобы
+    повторные GET попадали в его локальный кэш; остальные - на экземпляр
+    с наименьшим числом незавершённых запросов. Нездоровые (активная
+    проверка) и исключённые после серии ошибок экземпляры пропускаются.
+    """
+
+    def __init__(self, name: str, base_urls: str, config: UpstreamClientConfig):
+        self.name = name
+        self.config = config
+        self.instances: List[UpstreamInstance] = [
+            UpstreamInstance(url.strip().rstrip("/"), config)
+            for url in base_urls.split(",") if url.strip()
+        ]
+        self._ring: List[tuple] = sorted(
+            (_hash(f"{instance.base_url}#{vnode}"), index)
+            for index, instance in enumerate(self.instances)
+            for vnode in range(config.hash_ring_vnodes)
+        )
+        self._ring_keys = [point for point, _ in self._ring]
+        self._health_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Создать клиенты, прогреть соединения и запустить проверки здоровья"""
+        for instance in self.instances:
+            instance.start()
+        await self.prewarm()
+        if len(self.instances) > 1 and self.config.health_check_interval > 0:
+            self._health_task = asyncio.create_task(self._health_check_loop())
+
+    async def prewarm(self):
+        """Открыть несколько keep-alive соединений к каждому экземпляру заранее"""
+        # Встроенным экземплярам соединения не нужны
+        instances = [instance for instance in self.instances if not instance.embedded]
+        if self.config.prewarm_connections <= 0 or not instances:
+            return
+        results = await asyncio.gather(
+            *(instance.send("GET", self.config.prewarm_path, stream=False)
+              for instance in instances
+              for _ in range(self.config.prewarm_connections)),
+            return_exceptions=True,
+        )
+        warmed = sum(1 for r in results if not isinstance(r, Exception))
+        print(f"🔥 {self.name}: pre-warmed {warmed}/{len(results)} connections")
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await asyncio.gather(*(instance.close() for instance in self.instances))
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(self.config.health_check_interval)
+            await asyncio.gather(*(instance.check_health() for instance in self.instances))
+
+    def select(self, affinity_key: Optional[str] = None) -> UpstreamInstance:
+        if len(self.instances) == 1:
+            return self.instances[0]
+
+        now = time.monotonic()
+        candidates = [instance for instance in self.instances if instance.available(now)]
+        if not candidates:
+            # Panic mode: все экземпляры исключены - пробуем любой
+            candidates = self.instances
+
+        if affinity_key is not None and self.config.lb_strategy == "consistent_hash":
+            start = bisect.bisect(self._ring_keys, _hash(affinity_key))
+            for offset in range(len(self._ring)):
+                instance = self.instances[self._ring[(start + offset) % len(self._ring)][1]]
+                if instance in candidates:
+                    return instance
+
+        least = min(instance.in_flight for instance in candidates)
+        return random.choice([i for i in candidates if i.in_flight == least])
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        stream: bool = False,
+        timeout: Optional[float] = None,
+        affinity_key: Optional[str] = None,
+        **kwargs
+    ) -> httpx.Response:
+        """
+        Выполнить запрос через пул выбранного экземпляра
+
+        При stream=True тело ответа не читается: его нужно прочитать
+        через aiter_raw() и закрыть ответ вызовом aclose().
+        """
+        instance = self.select(affinity_key)
+        if instance.client is None:
+            raise RuntimeError(f"{self.name} upstream client is not started")
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, pool=self.config.pool_timeout)
+
+        with tracer.span(
+            f"{self.name} {method} {url}", kind="client", instance=instance.base_url
+        ) as span:
+            headers = httpx.Headers(kwargs.get("headers"))
+            # traceparent вызывающего заменяется контекстом gateway
+            traceparent = tracer.traceparent(span)
+            if traceparent is not None:
+                headers["traceparent"] = traceparent
+            # Бюджет, после которого gateway перестанет ждать ответа
+            budget = timeout if timeout is not None else self.config.request_timeout
+            headers[DEADLINE_HEADER] = str(int(budget * 1000))
+            kwargs["headers"] = headers
+
+            try:
+                response = await instance.send(method, url, stream, **kwargs)
+            except httpx.TransportError:
+                instance.record_failure()
+                raise
+            if span is not None:
+                span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                instance.record_failure()
+            else:
+                instance.record_success()
+            return response
+
+    def stats(self) -> dict:
+        """Статистика пулов для подбора размеров и балансировки"""
+        return {
+            "strategy": self.config.lb_strategy,
+            "max_connections": self.config.max_connections,
+            "max_keepalive_connections": self.config.max_keepalive_connections,
+            "keepalive_expiry": self.config.keepalive_expiry,
+            "in_flight": sum(instance.in_flight for instance in self.instances),
+            "instances": {
+                instance.base_url: instance.stats() for instance in self.instances
+            },
+        }
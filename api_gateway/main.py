@@ -1,11 +1,79 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-import httpx
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
 import asyncio
-from datetime import datetime, timedelta
-from typing import Dict, Optional
+import httpx
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from circuit_breaker import CircuitBreakerConfig, CircuitBreakerRegistry
+from compression import CompressionMiddleware
+from concurrency_limiter import ConcurrencyLimiter, ConcurrencyLimiterConfig
+from dataloader import DataLoader
+from embedded import EmbeddedConfig, EmbeddedServices
+from hedging import HedgedCaller, HedgingConfig
+from http_client import UpstreamClient, UpstreamClientConfig
+from metrics import CONTENT_TYPE, MetricsMiddleware, registry
+from rate_limiter import RateLimiter, RateLimiterConfig
+from response_cache import ResponseCache, ResponseCacheConfig
+from shared_state import SharedState, SharedStateConfig
+from single_flight import SingleFlight
+from tracing import TraceMiddleware, tracer
+from proxy import (
+    BufferedResponse,
+    ProxyConfig,
+    ProxyRoute,
+    ReverseProxy,
+    UpstreamServerError,
+    error_response,
+    forward_request_headers,
+)
+
+# Встроенный режим (EMBEDDED_MODE): сервисы в процессе gateway, без сети
+embedded = EmbeddedServices(EmbeddedConfig())
+embedded.load()
+
+# Адреса сервисов (несколько экземпляров - через запятую)
+USERS_SERVICE_URL = os.getenv("USERS_SERVICE_URL", embedded.url("users", "http://service_users:8000"))
+ORDERS_SERVICE_URL = os.getenv("ORDERS_SERVICE_URL", embedded.url("orders", "http://service_orders:8000"))
+PAYMENTS_SERVICE_URL = os.getenv("PAYMENTS_SERVICE_URL", embedded.url("payments", "http://service_payments:8000"))
+
+# Общие HTTP клиенты с пулом соединений (по одному на upstream)
+upstream_config = UpstreamClientConfig()
+users_upstream = UpstreamClient("Users", USERS_SERVICE_URL, upstream_config)
+orders_upstream = UpstreamClient("Orders", ORDERS_SERVICE_URL, upstream_config)
+payments_upstream = UpstreamClient("Payments", PAYMENTS_SERVICE_URL, upstream_config)
+upstreams = {
+    "users": users_upstream,
+    "orders": orders_upstream,
+    "payments": payments_upstream,
+}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Lifecycle events для FastAPI"""
+    # Startup
+    print("🚀 Initializing API Gateway...")
+    await embedded.start()
+    await asyncio.gather(*(upstream.start() for upstream in upstreams.values()))
+    print("✅ Upstream connection pools ready")
+    await shared_state.start()
+
+    yield
 
-app = FastAPI(title="API Gateway", version="1.0.0")
+    # Shutdown
+    print("👋 Shutting down API Gateway...")
+    await shared_state.close()
+    await asyncio.gather(*(upstream.close() for upstream in upstreams.values()))
+    await rate_limiter.close()
+    await embedded.close()
+
+
+app = FastAPI(title="API Gateway", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -14,326 +82,305 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор следующей страницы списков (keyset пагинация сервисов)
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Адреса сервисов
-USERS_SERVICE_URL = "http://service_users:8000"
-ORDERS_SERVICE_URL = "http://service_orders:8000"
-PAYMENTS_SERVICE_URL = "http://service_payments:8000"
-
-# Circuit Breaker configuration
-class CircuitBreakerConfig:
-    def __init__(self):
-        self.failure_threshold = 5
-        self.timeout_duration = 30
-        self.request_timeout = 3.0
-
-class CircuitBreaker:
-    def __init__(self, name: str, config: CircuitBreakerConfig):
-        self.name = name
-        self.config = config
-        self.failure_count = 0
-        self.last_failure_time: Optional[datetime] = None
-        self.state = "CLOSED"
-        
-    def is_open(self) -> bool:
-        if self.state == "OPEN":
-            if self.last_failure_time and \
-               datetime.now() - self.last_failure_time > timedelta(seconds=self.config.timeout_duration):
-                self.state = "HALF_OPEN"
-                print(f"🔄 {self.name} circuit breaker half-open")
-                return False
-            return True
-        return False
-    
-    def record_success(self):
-        self.failure_count = 0
-        if self.state == "HALF_OPEN":
-            self.state = "CLOSED"
-            print(f"✅ {self.name} circuit breaker closed")
-    
-    def record_failure(self):
-        self.failure_count += 1
-        self.last_failure_time = datetime.now()
-        if self.failure_count >= self.config.failure_threshold:
-            self.state = "OPEN"
-            print(f"🔴 {self.name} circuit breaker opened")
-    
-    async def call(self, func, *args, **kwargs):
-        if self.is_open():
-            raise HTTPException(
-                status_code=503,
-                detail=f"{self.name} service temporarily unavailable"
-            )
-        
-        try:
-            result = await func(*args, **kwargs)
-            self.record_success()
-            return result
-        except Exception as e:
-            self.record_failure()
-            raise e
-
-# Создаем circuit breakers
-config = CircuitBreakerConfig()
-users_circuit = CircuitBreaker("Users", config)
-orders_circuit = CircuitBreaker("Orders", config)
-payments_circuit = CircuitBreaker("Payments", config)
-
-# HTTP клиент
-async def make_request(url: str, method: str = "GET", data: dict = None):
-    async with httpx.AsyncClient(timeout=3.0) as client:
-        if method == "GET":
-            response = await client.get(url)
-        elif method == "POST":
-            response = await client.post(url, json=data)
-        elif method == "PUT":
-            response = await client.put(url, json=data)
-        elif method == "DELETE":
-            response = await client.delete(url)
-        
-        if response.status_code == 404:
-            return response.json()
-        response.raise_for_status()
-        return response.json()
+# Сжатие ответов по Accept-Encoding (уже сжатые upstream тела проходят как есть)
+app.add_middleware(CompressionMiddleware)
 
-# ============= USERS ENDPOINTS =============
+# Гистограмма задержки запросов к gateway по маршруту и статусу
+app.add_middleware(
+    MetricsMiddleware,
+    histogram=registry.histogram(
+        "gateway_request_duration_seconds",
+        "Gateway request latency by route and status",
+        ("method", "route", "status"),
+    ),
+)
 
-@app.get("/users/{user_id}")
-async def get_user(user_id: int):
-    try:
-        result = await users_circuit.call(
-            make_request,
-            f"{USERS_SERVICE_URL}/users/{user_id}"
-        )
-        if isinstance(result, dict) and "detail" in result:
-            raise HTTPException(status_code=404, detail=result["detail"])
-        return result
-    except HTTPException:
-        raise
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# Трассировка: серверный спан на запрос, traceparent передаётся в сервисы
+app.add_middleware(TraceMiddleware, service_name="api_gateway")
 
-@app.post("/users")
-async def create_user(request: Request):
-    try:
-        data = await request.json()
-        result = await users_circuit.call(
-            make_request,
-            f"{USERS_SERVICE_URL}/users",
-            method="POST",
-            data=data
-        )
-        return result
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"❌ Error creating user: {type(e).__name__}: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+# Circuit breakers по upstream и классу маршрута
+circuit_breakers = CircuitBreakerRegistry(CircuitBreakerConfig())
 
-@app.get("/users")
-async def get_users():
-    try:
-        result = await users_circuit.call(
-            make_request,
-            f"{USERS_SERVICE_URL}/users"
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# Адаптивные лимиты одновременных вызовов (по одному на upstream)
+limiter_config = ConcurrencyLimiterConfig()
+limiters = {
+    name: ConcurrencyLimiter(upstream.name, limiter_config)
+    for name, upstream in upstreams.items()
+}
 
-@app.delete("/users/{user_id}")
-async def delete_user(user_id: int):
-    try:
-        result = await users_circuit.call(
-            make_request,
-            f"{USERS_SERVICE_URL}/users/{user_id}",
-            method="DELETE"
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# Hedging, повторы и адаптивные таймауты для GET (по одному на upstream)
+hedging_config = HedgingConfig()
+hedging = {
+    name: HedgedCaller(
+        upstream.name,
+        hedging_config,
+        retryable=(httpx.TransportError, UpstreamServerError),
+        timeouts=(httpx.TimeoutException,),
+    )
+    for name, upstream in upstreams.items()
+}
 
-@app.put("/users/{user_id}")
-async def update_user(user_id: int, request: Request):
-    try:
-        data = await request.json()
-        result = await users_circuit.call(
-            make_request,
-            f"{USERS_SERVICE_URL}/users/{user_id}",
-            method="PUT",
-            data=data
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# In-process кэш GET ответов по пути upstream
+response_cache = ResponseCache(ResponseCacheConfig())
 
-# ============= ORDERS ENDPOINTS =============
+# Объединение одинаковых конкурентных GET запросов
+single_flight = SingleFlight()
 
-@app.get("/orders/{order_id}")
-async def get_order(order_id: int):
-    try:
-        result = await orders_circuit.call(
-            make_request,
-            f"{ORDERS_SERVICE_URL}/orders/{order_id}"
-        )
-        if isinstance(result, dict) and "detail" in result:
-            raise HTTPException(status_code=404, detail=result["detail"])
-        return result
-    except HTTPException:
-        raise
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# Распределённый rate limit по клиенту и классу маршрута (бакеты в Redis)
+rate_limiter = RateLimiter(RateLimiterConfig())
 
-@app.post("/orders")
-async def create_order(request: Request):
-    try:
-        data = await request.json()
-        result = await orders_circuit.call(
-            make_request,
-            f"{ORDERS_SERVICE_URL}/orders",
-            method="POST",
-            data=data
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.get("/orders")
-async def get_orders():
-    try:
-        result = await orders_circuit.call(
-            make_request,
-            f"{ORDERS_SERVICE_URL}/orders"
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+def state_snapshot() -> dict:
+    """Состояние этого воркера для общего хранилища"""
+    return {
+        "circuits": circuit_breakers.snapshot(),
+        "limiters": {name: limiter.stats() for name, limiter in limiters.items()},
+        "cache": response_cache.stats(),
+    }
 
-@app.delete("/orders/{order_id}")
-async def delete_order(order_id: int):
-    try:
-        result = await orders_circuit.call(
-            make_request,
-            f"{ORDERS_SERVICE_URL}/orders/{order_id}",
-            method="DELETE"
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
 
-@app.put("/orders/{order_id}")
-async def update_order(order_id: int, request: Request):
-    try:
-        data = await request.json()
-        result = await orders_circuit.call(
-            make_request,
-            f"{ORDERS_SERVICE_URL}/orders/{order_id}",
-            method="PUT",
-            data=data
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# Состояние, общее для воркеров gateway (shm на одном хосте или Redis)
+shared_state = SharedState(
+    SharedStateConfig(),
+    state_snapshot,
+    lambda peers: circuit_breakers.apply_peers([snapshot["circuits"] for snapshot in peers.values()]),
+)
 
-# ============= PAYMENTS ENDPOINTS =============
 
-@app.get("/payments/{payment_id}")
-async def get_payment(payment_id: int):
-    try:
-        result = await payments_circuit.call(
-            make_request,
-            f"{PAYMENTS_SERVICE_URL}/payments/{payment_id}"
-        )
-        if isinstance(result, dict) and "detail" in result:
-            raise HTTPException(status_code=404, detail=result["detail"])
-        return result
-    except HTTPException:
-        raise
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# Таблица маршрутизации: первый сегмент пути -> upstream и его circuit breakers
+routes = {
+    name: ProxyRoute(name, upstream, circuit_breakers, limiters[name], hedging[name])
+    for name, upstream in upstreams.items()
+}
 
-@app.post("/payments")
-async def create_payment(request: Request):
-    try:
-        data = await request.json()
-        result = await payments_circuit.call(
-            make_request,
-            f"{PAYMENTS_SERVICE_URL}/payments",
-            method="POST",
-            data=data
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+proxy = ReverseProxy(routes, response_cache, single_flight, rate_limiter, ProxyConfig())
 
-@app.get("/payments")
-async def get_payments():
-    try:
-        result = await payments_circuit.call(
-            make_request,
-            f"{PAYMENTS_SERVICE_URL}/payments"
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# ============= DATA LOADERS =============
 
-@app.delete("/payments/{payment_id}")
-async def delete_payment(payment_id: int):
-    try:
-        result = await payments_circuit.call(
-            make_request,
-            f"{PAYMENTS_SERVICE_URL}/payments/{payment_id}",
-            method="DELETE"
-        )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+# Не больше, чем принимают пакетные эндпоинты сервисов (BATCH_LOOKUP_MAX_IDS)
+BATCH_LOOKUP_MAX_IDS = int(os.getenv("BATCH_LOOKUP_MAX_IDS", 100))
 
-@app.put("/payments/{payment_id}")
-async def update_payment(payment_id: int, request: Request):
-    try:
-        data = await request.json()
-        result = await payments_circuit.call(
-            make_request,
-            f"{PAYMENTS_SERVICE_URL}/payments/{payment_id}",
-            method="PUT",
-            data=data
+NOT_FOUND_DETAILS = {
+    "users": "User not found",
+    "orders": "Order not found",
+    "payments": "Payment not found",
+}
+
+
+def ids_loader(name: str, param: str = "ids", group_by: Optional[str] = None) -> DataLoader:
+    """
+    Per-request DataLoader поверх GET /{name}?{param}=1,2,3
+
+    Без group_by значение ключа - сущность с этим id, иначе - список
+    сущностей, у которых поле group_by равно ключу.
+    """
+    async def batch_fn(keys: List[int]) -> Dict[int, Any]:
+        response = await proxy.fetch(
+            routes[name],
+            f"/{name}",
+            params={param: ",".join(map(str, keys))}
         )
-        return result
-    except Exception:
-        raise HTTPException(status_code=500, detail="Internal server error")
+        if response.status_code != 200:
+            raise HTTPException(status_code=502, detail=f"{name} batch lookup failed")
+        items = response.json()
+        if group_by is None:
+            return {item["id"]: item for item in items}
+        grouped: Dict[int, List[dict]] = {key: [] for key in keys}
+        for item in items:
+            grouped[item[group_by]].append(item)
+        return grouped
+
+    return DataLoader(batch_fn, BATCH_LOOKUP_MAX_IDS)
+
+
+def entity_loader(name: str):
+    """Загрузка сущности по id через DataLoader в виде ответа upstream (для /batch)"""
+    loader = ids_loader(name)
+
+    async def load(entity_id: int) -> BufferedResponse:
+        item = await loader.load(entity_id)
+        if item is None:
+            return error_response(404, NOT_FOUND_DETAILS[name])
+        return BufferedResponse(200, [("content-type", "application/json")], json.dumps(item).encode())
+
+    return load
 
 # ============= API AGGREGATION =============
 
+# Постраничная выборка заказов пользователя для агрегации
+DETAILS_PAGE_SIZE = int(os.getenv("DETAILS_PAGE_SIZE", 100))
+DETAILS_MAX_ORDERS = int(os.getenv("DETAILS_MAX_ORDERS", 1000))
+
+
+async def fetch_user_orders_page(user_id: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Страница заказов пользователя и курсор следующей
+    (фильтр userId и keyset пагинация выполняются в orders сервисе)
+    """
+    params = {"userId": user_id, "limit": DETAILS_PAGE_SIZE}
+    if cursor:
+        params["cursor"] = cursor
+    response = await proxy.fetch(routes["orders"], "/orders", params=params)
+    if response.status_code != 200:
+        raise HTTPException(status_code=502, detail="orders page lookup failed")
+    next_cursor = dict(response.headers).get("x-next-cursor")
+    return response.json(), next_cursor
+
+
+async def embed_payments(orders: List[dict], payments_loader: DataLoader) -> List[dict]:
+    """Добавить платежи к заказам (загрузки по заказам собираются в запросы по order_ids)"""
+    payments = await payments_loader.load_many([order["id"] for order in orders])
+    return [
+        {**order, "payments": order_payments}
+        for order, order_payments in zip(orders, payments)
+    ]
+
+
+async def stream_user_details(
+    user: dict,
+    user_id: int,
+    page: List[dict],
+    cursor: Optional[str],
+    payments_loader: Optional[DataLoader],
+):
+    """
+    Потоковая отдача агрегата пользователя
+
+    Заказы отдаются по мере загрузки страниц (по курсору, поэтому
+    вставки не сдвигают страницы), а итоговые поля count / truncated /
+    complete позволяют клиенту понять, полный ли получен список.
+    Статус ответа уже отправлен, поэтому ошибка загрузки следующей
+    страницы передаётся полем error.
+    """
+    yield '{"user": ' + json.dumps(user) + ', "orders": ['
+    count = 0
+    truncated = False
+    error = None
+    while True:
+        for order in page:
+            if count >= DETAILS_MAX_ORDERS:
+                truncated = True
+                break
+            yield ("," if count else "") + json.dumps(order)
+            count += 1
+        if truncated or cursor is None:
+            break
+        try:
+            page, cursor = await fetch_user_orders_page(user_id, cursor)
+            if payments_loader is not None:
+                page = await embed_payments(page, payments_loader)
+        except HTTPException as e:
+            error = e.detail
+            break
+        except Exception as e:
+            print(f"❌ Error loading orders page for user {user_id}: {type(e).__name__}: {str(e)}")
+            error = "Internal server error"
+            break
+    tail = '], "count": %d, "truncated": %s, "complete": %s' % (
+        count, json.dumps(truncated), json.dumps(error is None)
+    )
+    if error is not None:
+        tail += ', "error": ' + json.dumps(error)
+    yield tail + '}'
+
+
 @app.get("/users/{user_id}/details")
-async def get_user_details(user_id: int):
-    """API Aggregation: Получить пользователя с его заказами"""
+async def get_user_details(request: Request, user_id: int, include_payments: bool = False):
+    """API Aggregation: Получить пользователя с его заказами (и платежами)"""
+    rate_headers = await rate_limiter.enforce(request, "list")
+    payments_loader = (
+        ids_loader("payments", param="order_ids", group_by="order_id") if include_payments else None
+    )
     try:
-        user_task = users_circuit.call(
-            make_request,
-            f"{USERS_SERVICE_URL}/users/{user_id}"
-        )
-        orders_task = orders_circuit.call(
-            make_request,
-            f"{ORDERS_SERVICE_URL}/orders"
+        user_response, (first_page, cursor) = await asyncio.gather(
+            proxy.cached_fetch(routes["users"], f"/users/{user_id}"),
+            fetch_user_orders_page(user_id)
         )
         
-        user, all_orders = await asyncio.gather(user_task, orders_task)
+        if user_response.status_code == 404:
+            raise HTTPException(status_code=404, detail=user_response.json()["detail"])
+        user = user_response.json()
         
-        if isinstance(user, dict) and "detail" in user:
-            raise HTTPException(status_code=404, detail=user["detail"])
-        
-        user_orders = [order for order in all_orders if order.get("userId") == user_id]
-        
-        return {
-            "user": user,
-            "orders": user_orders
-        }
+        if payments_loader is not None:
+            first_page = await embed_payments(first_page, payments_loader)
     except HTTPException:
         raise
     except Exception:
         raise HTTPException(status_code=500, detail="Internal server error")
+    
+    return StreamingResponse(
+        stream_user_details(user, user_id, first_page, cursor, payments_loader),
+        media_type="application/json",
+        headers=rate_headers,
+    )
+
+# ============= BATCH =============
+
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", 50))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", 10))
+
+
+class BatchSubRequest(BaseModel):
+    """Под-запрос пакета"""
+    method: str = Field(default="GET", pattern="^(GET|POST|PUT|PATCH|DELETE)$")
+    path: str = Field(..., pattern="^/")
+    body: Optional[Any] = None
+
+
+class BatchRequest(BaseModel):
+    """Пакет под-запросов"""
+    requests: List[BatchSubRequest] = Field(..., min_length=1, max_length=BATCH_MAX_REQUESTS)
+
+
+def encode_batch_item(response: BufferedResponse) -> bytes:
+    """JSON тела upstream вставляются как есть, без повторного разбора"""
+    content_type = dict(response.headers).get("content-type", "")
+    if response.body and "json" in content_type:
+        body = response.body
+    elif response.body:
+        body = json.dumps(response.body.decode("utf-8", errors="replace")).encode()
+    else:
+        body = b"null"
+    return b'{"status": %d, "body": %s}' % (response.status_code, body)
+
+
+@app.post("/batch")
+async def batch(batch_request: BatchRequest, request: Request):
+    """Несколько под-запросов за один round trip; результаты в исходном порядке"""
+    # Пакет списывает по токену за под-запрос из одного бакета (один вызов Redis)
+    has_writes = any(sub.method != "GET" for sub in batch_request.requests)
+    rate_headers = await rate_limiter.enforce(
+        request, "write" if has_writes else "list", cost=len(batch_request.requests)
+    )
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+    # GET /users/{id} и т.п. из одного пакета уходят одним запросом ?ids=
+    loaders = {name: entity_loader(name) for name in routes}
+    headers = [
+        (name, value) for name, value in forward_request_headers(request)
+        if name not in ("content-length", "content-type")
+    ]
+
+    async def run(sub: BatchSubRequest) -> BufferedResponse:
+        content = None
+        sub_headers = headers
+        if sub.body is not None:
+            content = json.dumps(sub.body).encode()
+            sub_headers = headers + [("content-type", "application/json")]
+        async with semaphore:
+            return await proxy.dispatch(
+                sub.method, sub.path, headers=sub_headers, content=content, loaders=loaders
+            )
+
+    results = await asyncio.gather(*(run(sub) for sub in batch_request.requests))
+    return Response(
+        content=b'{"responses": [' + b", ".join(map(encode_batch_item, results)) + b"]}",
+        media_type="application/json",
+        headers=rate_headers,
+    )
 
 # ============= HEALTH & STATUS =============
 
@@ -341,26 +388,108 @@ async def get_user_details(user_id: int):
 async def health():
     return {
         "status": "API Gateway is running",
-        "circuits": {
-            "users": {
-                "status": users_circuit.state,
-                "failure_count": users_circuit.failure_count
-            },
-            "orders": {
-                "status": orders_circuit.state,
-                "failure_count": orders_circuit.failure_count
-            },
-            "payments": {
-                "status": payments_circuit.state,
-                "failure_count": payments_circuit.failure_count
-            }
-        }
+        "circuits": circuit_breakers.stats(),
+        "limiters": {name: limiter.stats() for name, limiter in limiters.items()},
+        "hedging": {name: caller.stats() for name, caller in hedging.items()},
+        "cache": response_cache.stats(),
+        "single_flight": single_flight.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "upstreams": {
+            name: upstream.stats() for name, upstream in upstreams.items()
+        },
+        "cluster": shared_state.cluster_stats(),
+    }
+
+# Состояние компонентов gateway читается только при запросе /metrics
+CIRCUIT_STATES = {"CLOSED": 0, "HALF_OPEN": 1, "OPEN": 2}
+
+registry.gauge(
+    "gateway_circuit_state", "Circuit state (0 closed, 1 half-open, 2 open)", ("circuit",),
+    lambda: {(name,): CIRCUIT_STATES[b.state] for name, b in circuit_breakers.breakers.items()},
+)
+registry.gauge(
+    "gateway_circuit_rejected", "Calls rejected by an open circuit", ("circuit",),
+    lambda: {(name,): b.rejected for name, b in circuit_breakers.breakers.items()},
+)
+registry.gauge(
+    "gateway_limiter_limit", "Current adaptive concurrency limit", ("upstream",),
+    lambda: {(name,): int(l.limit) for name, l in limiters.items()},
+)
+registry.gauge(
+    "gateway_limiter_in_flight", "Upstream calls holding a limiter slot", ("upstream",),
+    lambda: {(name,): l.in_flight for name, l in limiters.items()},
+)
+registry.gauge(
+    "gateway_limiter_shed", "Requests shed by the limiter", ("upstream", "lane"),
+    lambda: {(name, lane): n for name, l in limiters.items() for lane, n in l.shed.items()},
+)
+registry.gauge(
+    "gateway_hedges", "Hedged requests sent", ("upstream",),
+    lambda: {(name,): c.hedges for name, c in hedging.items()},
+)
+registry.gauge(
+    "gateway_retries", "Retried upstream calls", ("upstream",),
+    lambda: {(name,): c.retries for name, c in hedging.items()},
+)
+registry.gauge(
+    "gateway_cache_events", "Response cache events", ("event",),
+    lambda: {
+        (event,): getattr(response_cache, event)
+        for event in ("hits", "stale_hits", "misses", "evictions", "invalidations")
+    },
+)
+registry.gauge(
+    "gateway_rate_limited", "Requests rejected with 429", ("route_class",),
+    lambda: {(route_class,): n for route_class, n in rate_limiter.limited.items()},
+)
+registry.gauge(
+    "gateway_cluster_workers", "Gateway workers sharing state (including this one)", (),
+    lambda: {(): len(shared_state.snapshots) or 1},
+)
+registry.gauge(
+    "gateway_single_flight_coalesced", "GETs served by joining an in-flight call", (),
+    lambda: {(): single_flight.coalesced},
+)
+registry.gauge(
+    "gateway_upstream_in_flight", "In-flight requests per upstream instance", ("upstream", "instance"),
+    lambda: {
+        (name, i.base_url): i.in_flight
+        for name, upstream in upstreams.items() for i in upstream.instances
+    },
+)
+registry.gauge(
+    "gateway_upstream_healthy", "Upstream instance health (1 healthy)", ("upstream", "instance"),
+    lambda: {
+        (name, i.base_url): int(i.healthy)
+        for name, upstream in upstreams.items() for i in upstream.instances
+    },
+)
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в формате Prometheus"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/debug/traces")
+async def debug_traces(trace_id: Optional[str] = None, limit: int = 100):
+    """Последние спаны из кольцевого буфера (новые первыми)"""
+    return {
+        "sample_rate": tracer.config.sample_rate,
+        "exported": tracer.exporter.exported,
+        "spans": tracer.exporter.recent(trace_id, limit),
     }
 
 @app.get("/status")
 async def status():
     return {"status": "API Gateway is running"}
 
+# ============= REVERSE PROXY =============
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE"])
+async def proxy_request(path: str, request: Request):
+    """Потоковое проксирование в upstream по таблице маршрутов"""
+    return await proxy.handle(request, path)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,477 @@
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+import httpx
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from circuit_breaker import CircuitBreaker, CircuitBreakerRegistry
+from concurrency_limiter import ConcurrencyLimiter
+from hedging import HedgedCaller
+from http_client import UpstreamClient
+from rate_limiter import RateLimiter
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+
+
+# Hop-by-hop заголовки не передаются через прокси (RFC 7230, 6.1)
+HOP_BY_HOP_HEADERS = {
+    "connection",
+    "keep-alive",
+    "proxy-authenticate",
+    "proxy-authorization",
+    "te",
+    "trailers",
+    "transfer-encoding",
+    "upgrade",
+}
+
+# Заголовки, которые выставляет сам gateway
+REQUEST_HEADERS_SKIP = HOP_BY_HOP_HEADERS | {"host"}
+RESPONSE_HEADERS_SKIP = HOP_BY_HOP_HEADERS | {"server", "date", "x-trace-id"}
+
+BODY_METHODS = ("POST", "PUT", "PATCH")
+WRITE_METHODS = ("PUT", "PATCH", "DELETE")
+# Пути сервисов, которые получают собственную метку в метриках
+METRICS_SUBROUTES = ("export", "bulk", "status", "health")
+
+
+# Reverse proxy configuration
+class ProxyConfig:
+    def __init__(self):
+        self.max_page_size = int(os.getenv("GATEWAY_MAX_PAGE_SIZE", 500))
+        # Таймаут выгрузок /{service}/export: до первого байта и между кусками
+        self.export_timeout = float(os.getenv("GATEWAY_EXPORT_TIMEOUT", 300))
+
+
+class UpstreamServerError(Exception):
+    """Upstream ответил 5xx: считается отказом для circuit breaker"""
+
+    def __init__(self, response: "BufferedResponse"):
+        super().__init__(f"upstream returned {response.status_code}")
+        self.response = response
+
+
+class BufferedResponse:
+    """Ответ upstream, прочитанный целиком (без разбора JSON)"""
+
+    __slots__ = ("status_code", "headers", "body")
+
+    def __init__(self, status_code: int, headers: List[Tuple[str, str]], body: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body)
+
+    def to_response(self) -> Response:
+        return Response(
+            content=self.body,
+            status_code=self.status_code,
+            headers=dict(self.headers),
+        )
+
+
+def error_response(status_code: int, detail: str, headers: Optional[dict] = None) -> BufferedResponse:
+    return BufferedResponse(
+        status_code,
+        [("content-type", "application/json"), *(headers or {}).items()],
+        json.dumps({"detail": detail}).encode(),
+    )
+
+
+def forward_request_headers(request: Request) -> List[Tuple[str, str]]:
+    headers = [
+        (name, value) for name, value in request.headers.items()
+        if name not in REQUEST_HEADERS_SKIP
+    ]
+    client_host = request.client.host if request.client else None
+    if client_host:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        headers = [(n, v) for n, v in headers if n != "x-forwarded-for"]
+        headers.append((
+            "x-forwarded-for",
+            f"{forwarded_for}, {client_host}" if forwarded_for else client_host
+        ))
+    if "accept-encoding" not in request.headers:
+        # Иначе httpx подставит свой Accept-Encoding, и сжатое тело уйдёт клиенту, не просившему сжатия
+        headers.append(("accept-encoding", "identity"))
+    headers.append(("x-forwarded-proto", request.url.scheme))
+    if "host" in request.headers:
+        headers.append(("x-forwarded-host", request.headers["host"]))
+    return headers
+
+
+def filter_response_headers(headers: httpx.Headers, decoded: bool = False) -> List[Tuple[str, str]]:
+    skip = RESPONSE_HEADERS_SKIP
+    if decoded:
+        # Тело уже распаковано httpx - длину и кодировку считаем заново
+        skip = skip | {"content-encoding", "content-length"}
+    return [(name, value) for name, value in headers.multi_items() if name not in skip]
+
+
+# HTTP клиент
+async def make_request(
+    upstream: UpstreamClient,
+    path: str,
+    method: str = "GET",
+    params=None,
+    headers=None,
+    content=None,
+    timeout: Optional[float] = None,
+    affinity_key: Optional[str] = None,
+) -> BufferedResponse:
+    """Запрос к upstream с чтением тела целиком; 5xx поднимается как ошибка"""
+    if headers is not None:
+        # Тело распаковывается httpx - кодировку выбирает он сам, а не клиент
+        headers = [(n, v) for n, v in headers if n.lower() != "accept-encoding"]
+    response = await upstream.request(
+        method, path, params=params, headers=headers, content=content, timeout=timeout,
+        affinity_key=affinity_key
+    )
+    buffered = BufferedResponse(
+        response.status_code,
+        filter_response_headers(response.headers, decoded=True),
+        response.content,
+    )
+    if response.status_code >= 500:
+        raise UpstreamServerError(buffered)
+    return buffered
+
+
+async def open_stream(
+    upstream: UpstreamClient,
+    path: str,
+    method: str = "GET",
+    params=None,
+    headers=None,
+    content=None,
+    timeout: Optional[float] = None,
+    affinity_key: Optional[str] = None,
+) -> httpx.Response:
+    """Запрос к upstream без чтения тела; 5xx поднимается как ошибка"""
+    response = await upstream.request(
+        method, path, stream=True, params=params, headers=headers, content=content,
+        timeout=timeout, affinity_key=affinity_key
+    )
+    if response.status_code >= 500:
+        try:
+            await response.aread()
+        finally:
+            await response.aclose()
+        raise UpstreamServerError(BufferedResponse(
+            response.status_code,
+            filter_response_headers(response.headers, decoded=True),
+            response.content,
+        ))
+    return response
+
+
+# Классы маршрутов: у каждого свой circuit breaker в пределах upstream
+ROUTE_CLASSES = ("entity", "list", "write")
+
+
+class ProxyRoute:
+    """Запись таблицы маршрутизации: upstream и его circuit breakers"""
+
+    def __init__(
+        self,
+        name: str,
+        upstream: UpstreamClient,
+        circuits: CircuitBreakerRegistry,
+        limiter: ConcurrencyLimiter,
+        hedging: HedgedCaller,
+    ):
+        self.name = name
+        self.upstream = upstream
+        self.limiter = limiter
+        self.hedging = hedging
+        self.circuits = {
+            route_class: circuits.get(f"{name}:{route_class}")
+            for route_class in ROUTE_CLASSES
+        }
+
+    def circuit(self, route_class: str) -> CircuitBreaker:
+        return self.circuits[route_class]
+
+    async def call(self, route_class: str, func, *args, **kwargs):
+        """Вызов upstream через лимитер (полоса read/write) и circuit breaker"""
+        lane = "write" if route_class == "write" else "read"
+        return await self.limiter.call(
+            lane, self.circuit(route_class).call, func, *args, **kwargs
+        )
+
+    async def call_idempotent(self, route_class: str, func, *args, discard=None, **kwargs):
+        """Идемпотентный вызов: адаптивный таймаут, hedging и повторы в рамках бюджета"""
+        return await self.hedging.call(
+            lambda timeout: self.call(route_class, func, *args, timeout=timeout, **kwargs),
+            discard=discard,
+            route_class=route_class,
+        )
+
+
+class ReverseProxy:
+    """
+    Табличный потоковый reverse proxy
+
+    Первый сегмент пути выбирает upstream из таблицы маршрутов.
+    Тела запросов и ответов передаются как есть, потоком байтов,
+    без разбора JSON. GET сущности по id идёт через кэш и single-flight.
+    """
+
+    def __init__(
+        self,
+        routes: Dict[str, ProxyRoute],
+        cache: ResponseCache,
+        single_flight: SingleFlight,
+        rate_limiter: RateLimiter,
+        config: ProxyConfig,
+    ):
+        self.routes = routes
+        self.cache = cache
+        self.single_flight = single_flight
+        self.rate_limiter = rate_limiter
+        self.config = config
+
+    async def fetch(
+        self,
+        route: ProxyRoute,
+        path: str,
+        params=None,
+        route_class: str = "list",
+    ) -> BufferedResponse:
+        """GET через single-flight: одинаковые конкурентные запросы делят один вызов"""
+        key = f"{path}?{urlencode(sorted(httpx.QueryParams(params).multi_items()))}" if params else path
+        return await self.single_flight.do(
+            key,
+            lambda: route.call_idempotent(
+                route_class, make_request, route.upstream, path, params=params,
+                affinity_key=path if route_class == "entity" else None
+            ),
+        )
+
+    async def cached_fetch(self, route: ProxyRoute, path: str) -> BufferedResponse:
+        """GET через кэш gateway (404 кэшируются на короткое время)"""
+        return await self.cache.get_or_fetch(
+            path,
+            lambda: self.fetch(route, path, route_class="entity"),
+            is_negative=lambda response: response.status_code == 404,
+        )
+
+    def _invalidate(self, path: str):
+        """
+        После записи: удалить ответ из кэша и отцепить GET, начатый до записи,
+        чтобы следующие GET не получили (и не закэшировали) старое тело
+        """
+        self.cache.invalidate(path)
+        self.single_flight.forget(path)
+
+    def _query_params(self, items) -> List[Tuple[str, str]]:
+        """Параметры запроса как есть, но с ограничением limit"""
+        params = []
+        for name, value in items:
+            if name == "limit":
+                try:
+                    value = str(min(int(value), self.config.max_page_size))
+                except ValueError:
+                    pass
+            params.append((name, value))
+        return params
+
+    @staticmethod
+    def _is_entity_path(path: str) -> bool:
+        parts = path.strip("/").split("/")
+        return len(parts) == 2 and parts[1].isdigit()
+
+    @staticmethod
+    def _is_export_path(path: str) -> bool:
+        parts = path.strip("/").split("/")
+        return len(parts) == 2 and parts[1] == "export"
+
+    @staticmethod
+    def _metrics_route(path: str) -> str:
+        """
+        Метка маршрута для метрик из фиксированного набора шаблонов
+
+        Имя сервиса уже проверено по routes, id заменяется на {id};
+        любой другой путь попадает в одну метку "other", чтобы клиент
+        не мог плодить ряды метрик произвольными URL.
+        """
+        parts = path.strip("/").split("/")
+        if len(parts) == 1:
+            return f"/{parts[0]}"
+        if len(parts) == 2:
+            if parts[1].isdigit():
+                return f"/{parts[0]}/{{id}}"
+            if parts[1] in METRICS_SUBROUTES:
+                return f"/{parts[0]}/{parts[1]}"
+        return "other"
+
+    async def handle(self, request: Request, path: str) -> Response:
+        route = self.routes.get(path.split("/", 1)[0])
+        if route is None:
+            raise HTTPException(status_code=404, detail="Not Found")
+
+        upstream_path = f"/{path}"
+        method = request.method
+        request.scope["metrics_route"] = self._metrics_route(path)
+        params = self._query_params(request.query_params.multi_items())
+        is_entity = self._is_entity_path(upstream_path)
+
+        if method != "GET":
+            route_class = "write"
+        elif is_entity and not params:
+            route_class = "entity"
+        else:
+            route_class = "list"
+        rate_headers = await self.rate_limiter.enforce(request, route_class)
+
+        response = await self._forward(request, route, upstream_path, params, is_entity)
+        response.headers.update(rate_headers)
+        return response
+
+    async def _forward(
+        self,
+        request: Request,
+        route: ProxyRoute,
+        upstream_path: str,
+        params: List[Tuple[str, str]],
+        is_entity: bool,
+    ) -> Response:
+        method = request.method
+        try:
+            if method == "GET" and is_entity and not params:
+                response = await self.cached_fetch(route, upstream_path)
+                return response.to_response()
+
+            try:
+                if method == "GET" and self._is_export_path(upstream_path):
+                    # Выгрузка читает всю таблицу: без hedging и повторов,
+                    # с длинным таймаутом; тело передаётся потоком как есть
+                    response = await route.call(
+                        "list",
+                        open_stream,
+                        route.upstream,
+                        upstream_path,
+                        params=params,
+                        headers=forward_request_headers(request),
+                        timeout=self.config.export_timeout,
+                    )
+                elif method == "GET":
+                    response = await route.call_idempotent(
+                        "list",
+                        open_stream,
+                        route.upstream,
+                        upstream_path,
+                        params=params,
+                        headers=forward_request_headers(request),
+                        discard=lambda r: r.aclose(),
+                    )
+                else:
+                    response = await route.call(
+                        "write",
+                        open_stream,
+                        route.upstream,
+                        upstream_path,
+                        method=method,
+                        params=params,
+                        headers=forward_request_headers(request),
+                        content=request.stream() if method in BODY_METHODS else None,
+                        affinity_key=upstream_path if is_entity else None,
+                    )
+            finally:
+                if method in WRITE_METHODS and is_entity:
+                    self._invalidate(upstream_path)
+
+            return StreamingResponse(
+                self._stream_body(response),
+                status_code=response.status_code,
+                headers=dict(filter_response_headers(response.headers)),
+                background=BackgroundTask(response.aclose),
+            )
+        except HTTPException:
+            raise
+        except Exception as e:
+            return self._error_response(route, e).to_response()
+
+    @staticmethod
+    async def _stream_body(response: httpx.Response):
+        """Тело upstream как есть; ответ закрывается и при обрыве передачи"""
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await response.aclose()
+
+    async def dispatch(
+        self,
+        method: str,
+        url: str,
+        headers=None,
+        content: bytes = None,
+        loaders: Optional[Dict[str, Callable[[int], Awaitable[BufferedResponse]]]] = None,
+    ) -> BufferedResponse:
+        """
+        Выполнить под-запрос с чтением ответа целиком (для /batch)
+
+        loaders - загрузка сущности по id для маршрута (промахи кэша gateway
+        собираются DataLoader в один пакетный запрос к upstream).
+        """
+        target = httpx.URL(url)
+        path = target.path
+        route = self.routes.get(path.strip("/").split("/", 1)[0])
+        if route is None:
+            return error_response(404, "Not Found")
+
+        params = self._query_params(target.params.multi_items())
+        is_entity = self._is_entity_path(path)
+
+        try:
+            if method == "GET":
+                if is_entity and not params:
+                    if loaders and route.name in loaders:
+                        entity_id = int(path.rstrip("/").rsplit("/", 1)[1])
+                        return await self.cache.get_or_fetch(
+                            path,
+                            lambda: loaders[route.name](entity_id),
+                            is_negative=lambda response: response.status_code == 404,
+                        )
+                    return await self.cached_fetch(route, path)
+                return await self.fetch(route, path, params=params)
+
+            try:
+                return await route.call(
+                    "write",
+                    make_request,
+                    route.upstream,
+                    path,
+                    method=method,
+                    params=params,
+                    headers=headers,
+                    content=content,
+                    affinity_key=path if is_entity else None,
+                )
+            finally:
+                if method in WRITE_METHODS and is_entity:
+                    self._invalidate(path)
+        except Exception as e:
+            return self._error_response(route, e)
+
+    @staticmethod
+    def _error_response(route: ProxyRoute, error: Exception) -> BufferedResponse:
+        """Ответ клиенту при ошибке вызова upstream"""
+        if isinstance(error, HTTPException):
+            return error_response(error.status_code, error.detail, error.headers)
+        if isinstance(error, UpstreamServerError):
+            return error.response
+        if isinstance(error, httpx.TimeoutException):
+            return error_response(504, f"{route.upstream.name} service timeout")
+        if isinstance(error, httpx.TransportError):
+            print(f"❌ {route.upstream.name} upstream error: {type(error).__name__}: {str(error)}")
+            return error_response(502, f"{route.upstream.name} service unavailable")
+        print(f"❌ Proxy error: {type(error).__name__}: {str(error)}")
+        return error_response(500, "Internal server error")
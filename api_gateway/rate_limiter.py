@@ -0,0 +1,164 @@
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import redis.asyncio as redis
+from fastapi import HTTPException, Request
+
+from http_client import env_bool
+
+
+# Rate limiting configuration
+class RateLimiterConfig:
+    def __init__(self):
+        self.enabled = env_bool("RATE_LIMIT_ENABLED", "true")
+        # redis - общие бакеты для всех реплик; local - только в процессе
+        # (по умолчанию во встроенном режиме, где Redis нет)
+        self.backend = os.getenv("RATE_LIMIT_BACKEND", "local" if env_bool("EMBEDDED_MODE") else "redis")
+        self.redis_host = os.getenv("REDIS_HOST", "cache")
+        self.redis_port = int(os.getenv("REDIS_PORT", 6379))
+        # Redis не должен стать узким местом: короткий таймаут и пауза после ошибки
+        self.redis_timeout = float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", 0.05))
+        self.redis_retry_interval = float(os.getenv("RATE_LIMIT_REDIS_RETRY_INTERVAL", 5.0))
+        # Заголовок с идентификатором клиента - только если его выставляет
+        # доверенный прокси / слой аутентификации; по умолчанию ключ - IP
+        self.client_header = os.getenv("RATE_LIMIT_CLIENT_HEADER", "").lower()
+        # Token bucket по классу маршрута: скорость (токенов/с) и ёмкость
+        self.buckets: Dict[str, Tuple[float, float]] = {
+            "entity": (
+                float(os.getenv("RATE_LIMIT_ENTITY_RATE", 100)),
+                float(os.getenv("RATE_LIMIT_ENTITY_BURST", 200)),
+            ),
+            "list": (
+                float(os.getenv("RATE_LIMIT_LIST_RATE", 20)),
+                float(os.getenv("RATE_LIMIT_LIST_BURST", 100)),
+            ),
+            "write": (
+                float(os.getenv("RATE_LIMIT_WRITE_RATE", 10)),
+                float(os.getenv("RATE_LIMIT_WRITE_BURST", 20)),
+            ),
+        }
+        # Локальные бакеты на случай недоступности Redis
+        self.fallback_max_clients = int(os.getenv("RATE_LIMIT_FALLBACK_MAX_CLIENTS", 10000))
+
+
+# Token bucket атомарно на стороне Redis; время берётся с сервера Redis,
+# чтобы часы реплик gateway не влияли на лимит
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+
+class LocalTokenBuckets:
+    """In-process token buckets (лимит действует на одну реплику gateway)"""
+
+    def __init__(self, max_clients: int):
+        self.max_clients = max_clients
+        self.buckets: OrderedDict = OrderedDict()
+
+    def take(self, key: str, rate: float, burst: float, cost: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, ts = self.buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - ts) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_clients:
+            self.buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class RateLimiter:
+    """
+    Распределённый rate limit по клиенту и классу маршрута
+
+    Бакеты хранятся в общем Redis (один EVALSHA на запрос), поэтому лимит
+    действует на все реплики gateway. Если Redis недоступен, на
+    redis_retry_interval включаются локальные бакеты.
+    """
+
+    def __init__(self, config: RateLimiterConfig):
+        self.config = config
+        self.client = redis.Redis(
+            host=config.redis_host,
+            port=config.redis_port,
+            socket_timeout=config.redis_timeout,
+            socket_connect_timeout=config.redis_timeout,
+        )
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.local = LocalTokenBuckets(config.fallback_max_clients)
+        self.redis_down_until = 0.0
+        self.limited: Dict[str, int] = {route_class: 0 for route_class in config.buckets}
+        self.fallback_calls = 0
+
+    async def close(self):
+        await self.client.aclose()
+
+    def client_key(self, request: Request) -> str:
+        client_id = self.config.client_header and request.headers.get(self.config.client_header)
+        if client_id:
+            return f"id:{client_id}"
+        return f"ip:{request.client.host if request.client else 'unknown'}"
+
+    async def _take(self, key: str, rate: float, burst: float, cost: float) -> Tuple[bool, float]:
+        if self.config.backend == "redis" and time.monotonic() >= self.redis_down_until:
+            try:
+                allowed, tokens = await self.script(keys=[key], args=[rate, burst, cost])
+                return bool(allowed), float(tokens)
+            except (redis.RedisError, OSError) as e:
+                print(f"⚠️  Rate limit Redis error: {e} - using local buckets")
+                self.redis_down_until = time.monotonic() + self.config.redis_retry_interval
+        self.fallback_calls += 1
+        return self.local.take(key, rate, burst, cost)
+
+    async def enforce(self, request: Request, route_class: str, cost: int = 1) -> Dict[str, str]:
+        """
+        Списать cost токенов; вернуть заголовки лимита или поднять 429
+        """
+        if not self.config.enabled:
+            return {}
+        rate, burst = self.config.buckets[route_class]
+        # Запрос дороже ёмкости бакета никогда бы не прошёл
+        cost = min(cost, burst)
+        key = f"ratelimit:{route_class}:{self.client_key(request)}"
+        allowed, tokens = await self._take(key, rate, burst, cost)
+
+        headers = {
+            "X-RateLimit-Limit": str(int(burst)),
+            "X-RateLimit-Remaining": str(int(tokens)),
+            "X-RateLimit-Reset": str(math.ceil((burst - tokens) / rate)),
+        }
+        if not allowed:
+            self.limited[route_class] += 1
+            headers["Retry-After"] = str(max(1, math.ceil((cost - tokens) / rate)))
+            raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=headers)
+        return headers
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.config.enabled,
+            "backend": self.config.backend,
+            "redis_available": time.monotonic() >= self.redis_down_until,
+            "limited": dict(self.limited),
+            "fallback_calls": self.fallback_calls,
+            "local_buckets": len(self.local.buckets),
+        }
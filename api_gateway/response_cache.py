@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+
+# Response cache configuration
+class ResponseCacheConfig:
+    def __init__(self):
+        self.max_entries = int(os.getenv("GATEWAY_CACHE_MAX_ENTRIES", 10000))
+        self.ttl = float(os.getenv("GATEWAY_CACHE_TTL", 5.0))
+        self.stale_ttl = float(os.getenv("GATEWAY_CACHE_STALE_TTL", 30.0))
+        self.negative_ttl = float(os.getenv("GATEWAY_CACHE_NEGATIVE_TTL", 1.0))
+
+
+class CacheEntry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class ResponseCache:
+    """
+    Ограниченный in-process кэш ответов upstream сервисов
+
+    Стратегия: TTL + LRU вытеснение + stale-while-revalidate
+    1. Свежая запись - отдаём сразу
+    2. Устаревшая, но в пределах stale_ttl - отдаём и обновляем в фоне
+    3. Иначе - идём в upstream и сохраняем результат
+    """
+
+    def __init__(self, config: ResponseCacheConfig):
+        self.config = config
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        # Токены незавершённых загрузок: инвалидация отменяет их запись в кэш
+        self._pending: dict = {}
+        self._refresh_tasks: set = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.refresh_errors = 0
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Any]],
+        is_negative: Optional[Callable[[Any], bool]] = None,
+    ) -> Any:
+        """Получить ответ из кэша или загрузить его через fetch"""
+        now = time.monotonic()
+        entry = self._entries.get(key)
+
+        if entry is not None:
+            if now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+            if now < entry.stale_until:
+                self._entries.move_to_end(key)
+                self.stale_hits += 1
+                if key not in self._pending:
+                    self._schedule_refresh(key, fetch, is_negative)
+                return entry.value
+            del self._entries[key]
+
+        self.misses += 1
+        token = object()
+        self._pending[key] = token
+        try:
+            value = await fetch()
+        except BaseException:
+            if self._pending.get(key) is token:
+                del self._pending[key]
+            raise
+        self._store(key, token, value, is_negative)
+        return value
+
+    def _schedule_refresh(self, key, fetch, is_negative):
+        token = object()
+        self._pending[key] = token
+
+        async def refresh():
+            try:
+                value = await fetch()
+            except Exception as e:
+                self.refresh_errors += 1
+                if self._pending.get(key) is token:
+                    del self._pending[key]
+                print(f"⚠️  Gateway cache refresh failed for {key}: {type(e).__name__}")
+                return
+            self._store(key, token, value, is_negative)
+
+        task = asyncio.create_task(refresh())
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+
+    def _store(self, key, token, value, is_negative):
+        # Запись была инвалидирована, пока шла загрузка
+        if self._pending.get(key) is not token:
+            return
+        del self._pending[key]
+
+        ttl = self.config.ttl
+        stale_ttl = self.config.stale_ttl
+        if is_negative is not None and is_negative(value):
+            ttl = self.config.negative_ttl
+            stale_ttl = 0.0
+        if ttl <= 0:
+            return
+
+        now = time.monotonic()
+        self._entries[key] = CacheEntry(value, now + ttl, now + ttl + stale_ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.config.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str):
+        """Удалить запись и отменить сохранение незавершённых загрузок"""
+        self._pending.pop(key, None)
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.config.max_entries,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "refresh_errors": self.refresh_errors,
+        }
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+import redis.asyncio as redis
+
+
+# Shared worker state configuration
+class SharedStateConfig:
+    def __init__(self):
+        # none - только локальное состояние; shm - файлы в tmpfs (один хост);
+        # redis - общий Redis (несколько хостов)
+        self.backend = os.getenv("SHARED_STATE_BACKEND", "none")
+        self.shm_path = os.getenv("SHARED_STATE_SHM_PATH", "/dev/shm/api_gateway_state")
+        self.redis_host = os.getenv("REDIS_HOST", "cache")
+        self.redis_port = int(os.getenv("REDIS_PORT", 6379))
+        self.redis_timeout = float(os.getenv("SHARED_STATE_REDIS_TIMEOUT", 0.2))
+        self.redis_prefix = os.getenv("SHARED_STATE_REDIS_PREFIX", "gateway:state")
+        # Как часто воркер публикует своё состояние и читает чужие
+        self.sync_interval = float(os.getenv("SHARED_STATE_SYNC_INTERVAL", 1.0))
+        # Состояние воркера, не обновлявшееся дольше ttl (упал), не учитывается
+        self.worker_ttl = float(os.getenv("SHARED_STATE_WORKER_TTL", 5.0))
+
+
+class FileStateStore:
+    """Снимок на воркер - файл в tmpfs, заменяемый атомарно (os.replace)"""
+
+    def __init__(self, config: SharedStateConfig):
+        self.path = config.shm_path
+        self.ttl = config.worker_ttl
+        os.makedirs(self.path, exist_ok=True)
+
+    async def publish(self, worker_id: str, snapshot: dict):
+        tmp_path = os.path.join(self.path, f".{worker_id}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, os.path.join(self.path, f"{worker_id}.json"))
+
+    async def collect(self) -> Dict[str, dict]:
+        now = time.time()
+        snapshots = {}
+        for name in os.listdir(self.path):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.path, name)
+            try:
+                if now - os.stat(path).st_mtime > self.ttl:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshots[name[:-len(".json")]] = json.load(f)
+            except (OSError, ValueError):
+                # Файл удалён другим воркером между listdir и чтением
+                continue
+        return snapshots
+
+    async def remove(self, worker_id: str):
+        try:
+            os.remove(os.path.join(self.path, f"{worker_id}.json"))
+        except OSError:
+            pass
+
+    async def close(self):
+        pass
+
+
+class RedisStateStore:
+    """Снимок на воркер - ключ с TTL в Redis; множество workers для перечисления"""
+
+    def __init__(self, config: SharedStateConfig):
+        self.client = redis.Redis(
+            host=config.redis_host,
+            port=config.redis_port,
+            socket_timeout=config.redis_timeout,
+            socket_connect_timeout=config.redis_timeout,
+        )
+        self.prefix = config.redis_prefix
+        self.ttl_ms = int(config.worker_ttl * 1000)
+
+    async def publish(self, worker_id: str, snapshot: dict):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(f"{self.prefix}:{worker_id}", json.dumps(snapshot), px=self.ttl_ms)
+        pipe.sadd(f"{self.prefix}:workers", worker_id)
+        await pipe.execute()
+
+    async def collect(self) -> Dict[str, dict]:
+        workers = sorted(w.decode() for w in await self.client.smembers(f"{self.prefix}:workers"))
+        if not workers:
+            return {}
+        values = await self.client.mget([f"{self.prefix}:{worker_id}" for worker_id in workers])
+        expired = [worker_id for worker_id, value in zip(workers, values) if value is None]
+        if expired:
+            await self.client.srem(f"{self.prefix}:workers", *expired)
+        return {
+            worker_id: json.loads(value)
+            for worker_id, value in zip(workers, values) if value is not None
+        }
+
+    async def remove(self, worker_id: str):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.delete(f"{self.prefix}:{worker_id}")
+        pipe.srem(f"{self.prefix}:workers", worker_id)
+        await pipe.execute()
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class SharedState:
+    """
+    Состояние gateway, общее для воркеров
+
+    Каждый воркер раз в sync_interval публикует снимок своего состояния
+    (snapshot_fn) и читает снимки остальных; on_sync получает снимки
+    других живых воркеров. Горячий путь запросов хранилище не трогает,
+    а снимок упавшего воркера просто перестаёт учитываться через worker_ttl.
+    """
+
+    def __init__(
+        self,
+        config: SharedStateConfig,
+        snapshot_fn: Callable[[], dict],
+        on_sync: Callable[[Dict[str, dict]], None],
+    ):
+        self.config = config
+        self.snapshot_fn = snapshot_fn
+        self.on_sync = on_sync
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.store = None
+        if config.backend == "shm":
+            self.store = FileStateStore(config)
+        elif config.backend == "redis":
+            self.store = RedisStateStore(config)
+        self.snapshots: Dict[str, dict] = {}
+        self.sync_errors = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.store is not None:
+            self._task = asyncio.create_task(self._sync_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.store is not None:
+            try:
+                await self.store.remove(self.worker_id)
+            except (redis.RedisError, OSError):
+                pass
+            await self.store.close()
+
+    async def sync(self):
+        snapshot = self.snapshot_fn()
+        try:
+            await self.store.publish(self.worker_id, snapshot)
+            snapshots = await self.store.collect()
+        except (redis.RedisError, OSError, ValueError) as e:
+            # Без хранилища воркер работает только со своим состоянием
+            self.sync_errors += 1
+            print(f"⚠️  Shared state sync error: {e}")
+            snapshots = {}
+        snapshots[self.worker_id] = snapshot
+        self.snapshots = snapshots
+        self.on_sync({wid: s for wid, s in snapshots.items() if wid != self.worker_id})
+
+    async def _sync_loop(self):
+        while True:
+            await self.sync()
+            await asyncio.sleep(self.config.sync_interval)
+
+    def cluster_stats(self) -> dict:
+        """Сводка по всем живым воркерам (по последней синхронизации)"""
+        snapshots = dict(self.snapshots)
+        snapshots[self.worker_id] = self.snapshot_fn()
+
+        circuits: Dict[str, dict] = {}
+        limiters: Dict[str, dict] = {}
+        cache = {"entries": 0, "hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        for snapshot in snapshots.values():
+            for name, circuit in snapshot["circuits"].items():
+                total = circuits.setdefault(name, {
+                    "workers": {"CLOSED": 0, "HALF_OPEN": 0, "OPEN": 0},
+                    "calls_in_window": 0,
+                    "failures_in_window": 0,
+                    "rejected": 0,
+                })
+                total["workers"][circuit["state"]] += 1
+                total["calls_in_window"] += circuit["calls"]
+                total["failures_in_window"] += circuit["failures"]
+                total["rejected"] += circuit["rejected"]
+            for name, limiter in snapshot["limiters"].items():
+                total = limiters.setdefault(name, {"limit": 0, "in_flight": 0, "shed": {}})
+                total["limit"] += limiter["limit"]
+                total["in_flight"] += limiter["in_flight"]
+                for lane, shed in limiter["shed"].items():
+                    total["shed"][lane] = total["shed"].get(lane, 0) + shed
+            for event in cache:
+                cache[event] += snapshot["cache"][event]
+        lookups = cache["hits"] + cache["stale_hits"] + cache["misses"]
+        cache["hit_ratio"] = round((cache["hits"] + cache["stale_hits"]) / lookups, 3) if lookups else 0.0
+
+        return {
+            "backend": self.config.backend,
+            "worker_id": self.worker_id,
+            "workers": sorted(snapshots),
+            "sync_errors": self.sync_errors,
+            "circuits": circuits,
+            "limiters": limiters,
+            "cache": cache,
+        }
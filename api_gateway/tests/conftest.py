@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Модули gateway импортируются как верхнеуровневые (from hedging import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from dataloader import DataLoader
+
+
+def recording_loader(max_batch_size: int = 100, delay: float = 0.0):
+    batches = []
+
+    async def batch_fn(keys):
+        batches.append(list(keys))
+        await asyncio.sleep(delay)
+        return {key: key * 10 for key in keys if key >= 0}
+
+    return DataLoader(batch_fn, max_batch_size), batches
+
+
+def test_loads_in_one_tick_are_batched():
+    async def scenario():
+        loader, batches = recording_loader()
+        assert await asyncio.gather(loader.load(1), loader.load(2), loader.load(1)) == [10, 20, 10]
+        assert batches == [[1, 2]]
+        # Результаты запоминаются на время жизни loader
+        assert await loader.load(2) == 20
+        assert batches == [[1, 2]]
+
+    asyncio.run(scenario())
+
+
+def test_batches_are_split_by_max_batch_size():
+    async def scenario():
+        loader, batches = recording_loader(max_batch_size=2)
+        assert await loader.load_many([1, 2, 3, 4, 5]) == [10, 20, 30, 40, 50]
+        assert batches == [[1, 2], [3, 4], [5]]
+        assert loader.batches == 3
+
+    asyncio.run(scenario())
+
+
+def test_missing_key_loads_as_none():
+    async def scenario():
+        loader, _ = recording_loader()
+        assert await loader.load_many([1, -1]) == [10, None]
+
+    asyncio.run(scenario())
+
+
+def test_batch_error_is_not_cached():
+    async def scenario():
+        failures = 1
+
+        async def batch_fn(keys):
+            nonlocal failures
+            if failures:
+                failures -= 1
+                raise RuntimeError("upstream down")
+            return {key: key for key in keys}
+
+        loader = DataLoader(batch_fn)
+        with pytest.raises(RuntimeError):
+            await loader.load(1)
+        assert await loader.load(1) == 1
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_batch_fails_waiters():
+    async def scenario():
+        loader, _ = recording_loader(delay=10)
+        load = loader.load(1)
+        await asyncio.sleep(0.01)
+        for task in list(loader._tasks):
+            task.cancel()
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(load, 1)
+        assert not loader._tasks
+
+    asyncio.run(scenario())
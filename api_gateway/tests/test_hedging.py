@@ -0,0 +1,136 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from hedging import HedgedCaller, HedgingConfig, RetryBudget
+
+
+def make_caller(**overrides) -> HedgedCaller:
+    config = HedgingConfig()
+    config.min_timeout = 0.05
+    config.max_timeout = 0.5
+    config.min_samples = 20
+    config.backoff_base = 0.001
+    config.backoff_max = 0.005
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return HedgedCaller(
+        "test", config, retryable=(httpx.TransportError,), timeouts=(httpx.TimeoutException,)
+    )
+
+
+def sleeper(delay):
+    """attempt(timeout), который отвечает через delay() секунд или падает по таймауту"""
+    calls = []
+
+    async def attempt(timeout):
+        calls.append(timeout)
+        try:
+            await asyncio.wait_for(asyncio.sleep(delay()), timeout)
+        except asyncio.TimeoutError:
+            raise httpx.ReadTimeout("timeout")
+        return len(calls)
+
+    attempt.calls = calls
+    return attempt
+
+
+def test_route_classes_have_separate_latency():
+    """Быстрые entity вызовы не задают таймаут и hedge для медленных list"""
+    async def scenario():
+        caller = make_caller()
+        for _ in range(40):
+            await caller.call(sleeper(lambda: 0.005), route_class="entity")
+        assert caller.timeout("entity") == caller.config.min_timeout
+        assert caller.hedge_delay("list") is None
+
+        slow = sleeper(lambda: 0.2)
+        await caller.call(slow, route_class="list")
+        assert slow.calls == [pytest.approx(caller.config.max_timeout, abs=0.01)]
+
+    asyncio.run(scenario())
+
+
+def test_timed_out_attempts_raise_the_timeout():
+    """Таймауты попадают в окно, и адаптивный таймаут растёт вслед за задержкой"""
+    async def scenario():
+        caller = make_caller(hedge_enabled=False, max_retries=0, window_size=40)
+        for _ in range(40):
+            await caller.call(sleeper(lambda: 0.005))
+        assert caller.timeout("entity") == caller.config.min_timeout
+
+        succeeded = 0
+        for _ in range(20):
+            try:
+                await caller.call(sleeper(lambda: 0.1))
+                succeeded += 1
+            except httpx.TimeoutException:
+                pass
+        assert caller.timeout("entity") > 0.1
+        assert succeeded > 0
+
+    asyncio.run(scenario())
+
+
+def test_retries_share_one_deadline():
+    """Повторы не продлевают вызов дальше max_timeout"""
+    async def scenario():
+        caller = make_caller(hedge_enabled=False, max_retries=5)
+        attempt = sleeper(lambda: 10)
+        started = time.monotonic()
+        with pytest.raises(httpx.TimeoutException):
+            await caller.call(attempt)
+        assert time.monotonic() - started < caller.config.max_timeout + 0.1
+
+    asyncio.run(scenario())
+
+
+def test_transport_errors_are_retried_within_budget():
+    async def scenario():
+        caller = make_caller(hedge_enabled=False, max_retries=2)
+        attempts = 0
+
+        async def flaky(timeout):
+            nonlocal attempts
+            attempts += 1
+            if attempts < 3:
+                raise httpx.ConnectError("refused")
+            return "ok"
+
+        assert await caller.call(flaky) == "ok"
+        assert caller.retries == 2
+
+        caller.budget.tokens = 0
+        attempts = 0
+        with pytest.raises(httpx.ConnectError):
+            await caller.call(flaky)
+        assert attempts == 1
+        assert caller.budget.exhausted == 1
+
+    asyncio.run(scenario())
+
+
+def test_slow_attempt_is_hedged():
+    async def scenario():
+        caller = make_caller()
+        for _ in range(20):
+            await caller.call(sleeper(lambda: 0.005))
+
+        delays = iter([0.3, 0.005])
+        assert await caller.call(sleeper(lambda: next(delays))) == 2
+        assert caller.hedges == 1
+        assert caller.hedge_wins == 1
+
+    asyncio.run(scenario())
+
+
+def test_retry_budget_refills_by_ratio():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+    assert budget.exhausted == 1
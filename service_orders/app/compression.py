@@ -0,0 +1,229 @@
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# brotli и zstd необязательны: без пакетов остаётся gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+AVAILABLE_ENCODINGS = tuple(
+    encoding for encoding, module in (("zstd", zstandard), ("br", brotli), ("gzip", zlib))
+    if module is not None
+)
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "application/javascript",
+    "text/",
+)
+
+
+# Response compression configuration
+class CompressionConfig:
+    def __init__(self):
+        # Ответы меньше порога не сжимаются - выигрыш не окупает CPU
+        self.min_size = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+        # Уровень по шкале gzip 1-9 (для brotli/zstd используется как quality/level)
+        self.level = int(os.getenv("COMPRESSION_LEVEL", 6))
+        # Порядок предпочтения кодировок сервером
+        self.encodings = [
+            encoding.strip() for encoding in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",")
+            if encoding.strip() in AVAILABLE_ENCODINGS
+        ]
+        # Уровни по префиксу пути: "/users=4,/orders=1" (0 - не сжимать)
+        self.route_levels: List[Tuple[str, int]] = sorted(
+            (
+                (prefix.strip(), int(level))
+                for prefix, _, level in (
+                    item.partition("=") for item in os.getenv("COMPRESSION_ROUTE_LEVELS", "").split(",")
+                    if item.strip()
+                )
+            ),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+
+    def level_for(self, path: str) -> int:
+        for prefix, level in self.route_levels:
+            if path.startswith(prefix):
+                return level
+        return self.level
+
+
+def negotiate(accept_encoding: str, encodings: List[str]) -> Optional[str]:
+    """Лучшая кодировка из Accept-Encoding (учитываются q-значения и *)"""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[token] = q
+
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class StreamCompressor:
+    """Потоковый компрессор: каждый кусок сбрасывается, чтобы клиент получал данные сразу"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "gzip":
+            self._compressor = zlib.compressobj(min(level, 9), zlib.DEFLATED, 31)
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=min(level, 11))
+        else:
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "gzip":
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.finish()
+        return self._compressor.compress(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware: сжатие ответа по Accept-Encoding
+
+    Ответы, у которых уже есть Content-Encoding (например, сжатые upstream
+    и проксируемые как есть), не трогаются. Vary: Accept-Encoding ставится
+    на всё, что могло быть сжато, в том числе отданное без сжатия, чтобы
+    общий кэш не выдал несжатую копию клиенту, принимающему сжатие.
+    """
+
+    def __init__(self, app, config: Optional[CompressionConfig] = None):
+        self.app = app
+        self.config = config or CompressionConfig()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+                break
+        encoding = negotiate(accept_encoding, self.config.encodings) if accept_encoding else None
+        level = self.config.level_for(scope["path"])
+        if not self.config.encodings or level <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(send, encoding, level, self.config.min_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressingResponder:
+    def __init__(self, send, encoding: Optional[str], level: int, min_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.level = level
+        self.min_size = min_size
+        self.start_message: Optional[dict] = None
+        self.compressor: Optional[StreamCompressor] = None
+        self.passthrough = False
+
+    def _compressible(self, headers: List[Tuple[bytes, bytes]], body_size: Optional[int]) -> bool:
+        if self.start_message["status"] in (204, 304) or self.start_message["status"] < 200:
+            return False
+        content_type = b""
+        for name, value in headers:
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value
+            if name == b"content-length" and body_size is None:
+                body_size = int(value)
+        if body_size is not None and body_size < self.min_size:
+            return False
+        return content_type.decode("latin-1").startswith(COMPRESSIBLE_TYPES)
+
+    @staticmethod
+    def _with_vary(headers):
+        for index, (name, value) in enumerate(headers):
+            if name == b"vary":
+                if value.strip() != b"*" and b"accept-encoding" not in value.lower():
+                    headers[index] = (name, value + b", Accept-Encoding")
+                return headers
+        headers.append((b"vary", b"Accept-Encoding"))
+        return headers
+
+    def _compressed_headers(self, headers, content_length: Optional[int]):
+        headers = [(n, v) for n, v in headers if n != b"content-length"]
+        headers.append((b"content-encoding", self.encoding.encode()))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode()))
+        return self._with_vary(headers)
+
+    async def send(self, message: dict):
+        if message["type"] == "http.response.start":
+            # Заголовки отправляются вместе с первым куском тела
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.passthrough:
+            await self._send(message)
+            return
+
+        if self.compressor is None:
+            headers = list(self.start_message.get("headers", []))
+            compressible = self._compressible(headers, None if more_body else len(body))
+            if not compressible or self.encoding is None:
+                if compressible:
+                    # Клиент не принимает сжатие, но ответ зависит от Accept-Encoding
+                    self.start_message["headers"] = self._with_vary(headers)
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+
+            self.compressor = StreamCompressor(self.encoding, self.level)
+            if not more_body:
+                compressed = self.compressor.finish(body)
+                self.start_message["headers"] = self._compressed_headers(headers, len(compressed))
+                await self._send(self.start_message)
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            self.start_message["headers"] = self._compressed_headers(headers, None)
+            await self._send(self.start_message)
+
+        chunk = self.compressor.compress(body) if more_body else self.compressor.finish(body)
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -1,37 +1,262 @@
-from sqlalchemy import create_engine
+from sqlalchemy import event, exc
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import os
+import time
+
+from . import deadline
+from .metrics import registry
+from .tracing import tracer
 
 DATABASE_URL = os.getenv(
     "DATABASE_URL",
     "postgresql://user:password@db_orders:5432/orders_db"
 )
 
-engine = create_engine(
-    DATABASE_URL,
-    pool_pre_ping=True,
+# Асинхронные драйверы: asyncpg для Postgres, aiosqlite для локального запуска
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def async_url(url: str) -> str:
+    """postgresql://... -> postgresql+asyncpg://... (явно указанный драйвер не меняется)"""
+    scheme, separator, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme, scheme) + separator + rest
+
+
+# Метрики БД: время SQL запросов, удержания соединения и жизни сессии
+DB_QUERY_LATENCY = registry.histogram(
+    "db_query_duration_seconds",
+    "SQL statement latency by statement type",
+    ("statement",),
+)
+DB_CONNECTION_HOLD = registry.histogram(
+    "db_connection_hold_seconds",
+    "Time a pooled connection stays checked out",
+)
+DB_SESSION_DURATION = registry.histogram(
+    "db_session_duration_seconds",
+    "Lifetime of a request DB session",
+)
+DB_POOL_WAIT = registry.histogram(
+    "db_pool_wait_seconds",
+    "Time waiting for a pooled connection (including opening a new one)",
+)
+DB_CHECKOUT_LATENCY = registry.histogram(
+    "db_pool_checkout_seconds",
+    "Full connection checkout latency (wait, connect, pre-ping)",
+)
+DB_PRE_PINGS = registry.counter(
+    "db_pool_pre_pings_total",
+    "Liveness checks of idle connections on checkout",
+    ("result",),
+)
+DB_SESSIONS = registry.counter(
+    "db_sessions_total",
+    "Request DB sessions by whether they touched the pool",
+    ("connection",),
+)
+STATEMENT_TYPES = {"SELECT", "INSERT", "UPDATE", "DELETE", "BEGIN", "COMMIT", "ROLLBACK"}
+
+
+# Database connection pool configuration
+class PoolConfig:
+    def __init__(self):
+        self.size = int(os.getenv("DB_POOL_SIZE", 5))
+        self.max_overflow = int(os.getenv("DB_MAX_OVERFLOW", 10))
+        self.timeout = float(os.getenv("DB_POOL_TIMEOUT", 30))
+        # Соединения старше recycle секунд пересоздаются (-1 - никогда)
+        self.recycle = int(os.getenv("DB_POOL_RECYCLE", 1800))
+        # always - SELECT 1 на каждый checkout; idle - только после простоя
+        # дольше pre_ping_idle секунд; never - без проверки
+        self.pre_ping = os.getenv("DB_POOL_PRE_PING", "idle")
+        self.pre_ping_idle = float(os.getenv("DB_POOL_PRE_PING_IDLE", 30))
+
+
+pool_config = PoolConfig()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Пул с замером ожидания соединения и полного checkout"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.observe(time.perf_counter() - started)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            DB_CHECKOUT_LATENCY.observe(time.perf_counter() - started)
+
+
+engine = create_async_engine(
+    async_url(DATABASE_URL),
+    poolclass=InstrumentedPool,
+    pool_size=pool_config.size,
+    max_overflow=pool_config.max_overflow,
+    pool_timeout=pool_config.timeout,
+    pool_recycle=pool_config.recycle,
+    pool_pre_ping=pool_config.pre_ping == "always",
     echo=False
 )
 
-SessionLocal = sessionmaker(
-    autocommit=False,
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    words = statement.split(None, 1)
+    verb = words[0].upper() if words else ""
+    verb = verb if verb in STATEMENT_TYPES else "OTHER"
+    span = tracer.start_span(f"SQL {verb}", kind="client", statement=statement[:500])
+    conn.info.setdefault("query_started", []).append((time.perf_counter(), verb, span))
+
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started, verb, span = conn.info["query_started"].pop()
+    DB_QUERY_LATENCY.labels(verb).observe(time.perf_counter() - started)
+    if span is not None:
+        span.finish()
+
+
+@event.listens_for(engine.sync_engine, "handle_error")
+def _handle_error(exception_context):
+    # after_cursor_execute не вызывается при ошибке - снимаем отметку здесь
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_started"):
+        _, _, span = conn.info["query_started"].pop()
+        if span is not None:
+            span.error = repr(exception_context.original_exception)
+            span.finish()
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    idle_since = connection_record.info.get("checked_in_at")
+    if pool_config.pre_ping == "idle" and idle_since is not None \
+            and time.perf_counter() - idle_since > pool_config.pre_ping_idle:
+        try:
+            alive = engine.dialect.do_ping(dbapi_connection)
+        except Exception:
+            alive = False
+        DB_PRE_PINGS.labels("ok" if alive else "failed").inc()
+        if not alive:
+            # Пул закроет соединение и повторит checkout с новым
+            raise exc.DisconnectionError()
+    connection_record.info["checked_out_at"] = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    connection_record.info["checked_in_at"] = time.perf_counter()
+    started = connection_record.info.pop("checked_out_at", None)
+    if started is not None:
+        DB_CONNECTION_HOLD.observe(time.perf_counter() - started)
+
+
+class SyncSession(Session):
+    """Синхронная сессия внутри AsyncSession (на ней слушаются события сессии)"""
+
+
+SessionLocal = async_sessionmaker(
+    engine,
+    class_=AsyncSession,
+    sync_session_class=SyncSession,
     autoflush=False,
-    bind=engine
+    # Объекты остаются доступны после commit без повторной загрузки
+    expire_on_commit=False
 )
 
+
+@event.listens_for(SyncSession, "after_begin")
+def _mark_connected(session, transaction, connection):
+    session.info["connected"] = True
+
+
+@event.listens_for(SyncSession, "after_begin")
+def _apply_deadline(session, transaction, connection):
+    """statement_timeout транзакции по оставшемуся бюджету запроса"""
+    budget = deadline.remaining()
+    if budget is None:
+        return
+    deadline.check()
+    if connection.dialect.name == "postgresql":
+        # SET LOCAL действует до конца транзакции, пул соединений не затрагивается
+        connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(budget * 1000))}")
+
 Base = declarative_base()
 
 
-def get_db():
-    """Dependency для получения сессии БД"""
+async def get_db():
+    """
+    Dependency для получения асинхронной сессии БД
+
+    Соединение берётся из пула только при первом запросе к БД, поэтому
+    ответы из кэша пул не затрагивают.
+    """
+    # Не занимаем соединение ради ответа, который уже никто не ждёт
+    deadline.check()
     db = SessionLocal()
+    started = time.perf_counter()
     try:
         yield db
     finally:
-        db.close()
+        DB_SESSIONS.labels("used" if db.info.get("connected") else "unused").inc()
+        await db.close()
+        DB_SESSION_DURATION.observe(time.perf_counter() - started)
+
+
+def _latency_summary(histogram) -> dict:
+    counts, total = histogram.labels().snapshot()
+    count = sum(counts)
+    return {"count": count, "avg_ms": round(total / count * 1000, 3) if count else 0.0}
+
+
+def pool_stats() -> dict:
+    """Состояние пула соединений (для /debug/db-pool)"""
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+        "max_overflow": pool_config.max_overflow,
+        "timeout": pool_config.timeout,
+        "recycle": pool_config.recycle,
+        "pre_ping": pool_config.pre_ping,
+        "pre_pings": {result: DB_PRE_PINGS.labels(result).value() for result in ("ok", "failed")},
+        "wait": _latency_summary(DB_POOL_WAIT),
+        "checkout": _latency_summary(DB_CHECKOUT_LATENCY),
+        "connection_hold": _latency_summary(DB_CONNECTION_HOLD),
+        "sessions": {state: DB_SESSIONS.labels(state).value() for state in ("used", "unused")},
+    }
+
+
+# Соединения пула для /metrics: занятые, свободные и сверх pool_size
+registry.gauge(
+    "db_pool_connections", "Pooled DB connections by state", ("state",),
+    lambda: {
+        ("checked_out",): engine.pool.checkedout(),
+        ("checked_in",): engine.pool.checkedin(),
+        ("overflow",): max(0, engine.pool.overflow()),
+    },
+)
+
+
+def _create_schema(connection):
+    Base.metadata.create_all(connection)
+    # create_all не добавляет новые индексы к уже существующим таблицам
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
 
 
-def init_db():
+async def init_db():
     """Инициализация базы данных (создание таблиц)"""
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(_create_schema)
@@ -0,0 +1,142 @@
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, Sequence
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+
+from . import deadline
+from .database import SessionLocal
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+# Bulk export configuration
+class ExportConfig:
+    def __init__(self):
+        # Строк на один fetch серверного курсора и на один кусок ответа
+        self.batch_size = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+
+export_config = ExportConfig()
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def _partitions(query, batch_size: int) -> AsyncIterator[Sequence]:
+    """
+    Строки запроса пачками через серверный курсор (stream_results)
+
+    Сессия открывается внутри потока ответа и держит соединение до конца
+    выгрузки. Дедлайн gateway ограничивает только время до первого байта,
+    поэтому statement_timeout на выгрузку не ставится.
+    """
+    deadline.request_deadline.set(None)
+    async with SessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+async def _ndjson(query, names: List[str], batch_size: int):
+    async for rows in _partitions(query, batch_size):
+        yield "".join(
+            json.dumps({name: _plain(value) for name, value in zip(names, row)}) + "\n"
+            for row in rows
+        )
+
+
+async def _csv(query, names: List[str], batch_size: int):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    yield buffer.getvalue()
+    async for rows in _partitions(query, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_plain(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+
+
+ARROW_TYPES = {int: "int64", float: "float64", str: "string", datetime: "timestamp[us]"}
+
+
+class _ArrowSink:
+    """Файловый объект для pyarrow: записанные байты забираются после каждой пачки"""
+
+    closed = False
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+async def _arrow(query, names: List[str], batch_size: int):
+    schema = pyarrow.schema([
+        (column.name, pyarrow.type_for_alias(ARROW_TYPES[column.type.python_type]))
+        for column in query.selected_columns
+    ])
+    sink = _ArrowSink()
+    writer = pyarrow.ipc.new_stream(sink, schema)
+    async for rows in _partitions(query, batch_size):
+        writer.write_batch(pyarrow.RecordBatch.from_arrays(
+            [pyarrow.array(column, type=field.type) for column, field in zip(zip(*rows), schema)],
+            schema=schema,
+        ))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+ENCODERS = {"ndjson": _ndjson, "csv": _csv, "arrow": _arrow}
+
+
+def export_response(query, fmt: str, filename: str) -> StreamingResponse:
+    """
+    Потоковая выгрузка результата запроса в NDJSON, CSV или Arrow IPC
+
+    Строки читаются пачками по EXPORT_BATCH_SIZE без ORM объектов и
+    Pydantic моделей, поэтому память не зависит от размера таблицы.
+    """
+    if fmt not in ENCODERS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"format must be one of: {', '.join(ENCODERS)}"
+        )
+    if fmt == "arrow" and pyarrow is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Arrow export requires pyarrow"
+        )
+    names = [column.name for column in query.selected_columns]
+    return StreamingResponse(
+        ENCODERS[fmt](query, names, export_config.batch_size),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
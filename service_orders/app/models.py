@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from datetime import datetime
 from .database import Base
 
@@ -6,6 +6,11 @@ from .database import Base
 class Order(Base):
     """Модель заказа в базе данных"""
     __tablename__ = "orders"
+    __table_args__ = (
+        # Keyset пагинация: весь список по (created_at, id), заказы пользователя по (userId, id)
+        Index("ix_orders_created_at_id", "created_at", "id"),
+        Index("ix_orders_userId_id", "userId", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     userId = Column(Integer, index=True, nullable=False)
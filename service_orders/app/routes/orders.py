@@ -1,30 +1,83 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, status, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List, Optional
+from datetime import datetime
+import os
 
 from ..database import get_db
-from ..schemas import OrderCreate, OrderUpdate, OrderResponse
+from ..pagination import set_next_cursor
+from ..export import export_response
+from ..bulk import validate_rows
+from ..schemas import OrderCreate, OrderUpdate, OrderResponse, OrderBulkResponse
 from ..services.order_service import order_service
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+# Максимум id в одном пакетном запросе
+MAX_BATCH_IDS = int(os.getenv("BATCH_LOOKUP_MAX_IDS", 100))
+
+
+def parse_ids(values: List[str]) -> List[int]:
+    """ids=1,2,3 и/или ids=1&ids=2 -> [1, 2, 3]"""
+    try:
+        ids = [int(part) for value in values for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be a comma-separated list of integers"
+        )
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_IDS} ids per request"
+        )
+    return ids
+
 
 @router.get("", response_model=List[OrderResponse])
-def get_orders(
+async def get_orders(
+    response: Response,
     userId: Optional[int] = Query(None),
+    ids: Optional[List[str]] = Query(None),
+    cursor: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получить список заказов с фильтрацией по userId"""
-    orders = order_service.get_all_orders(db, user_id=userId, skip=skip, limit=limit)
+    """
+    Получить список заказов с фильтрацией по userId или пакет по ids
+
+    Список упорядочен по (created_at, id), с userId - по (userId, id);
+    курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    """
+    if ids:
+        return await order_service.get_orders_by_ids(db, parse_ids(ids))
+    orders, next_page = await order_service.get_all_orders(
+        db, user_id=userId, cursor=cursor, limit=limit, skip=skip
+    )
+    set_next_cursor(response, next_page)
     return orders
 
 
+@router.get("/export")
+async def export_orders(
+    format: str = "ndjson",
+    userId: Optional[int] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    """Потоковая выгрузка заказов (ndjson, csv или arrow) с фильтрами по userId и created_at"""
+    return export_response(
+        order_service.export_query(user_id=userId, created_from=created_from, created_to=created_to),
+        format,
+        "orders"
+    )
+
+
 @router.get("/{order_id}", response_model=OrderResponse)
-def get_order(order_id: int, db: Session = Depends(get_db)):
+async def get_order(order_id: int, db: AsyncSession = Depends(get_db)):
     """Получить заказ по ID (с кэшированием)"""
-    order = order_service.get_order_by_id(db, order_id)
+    order = await order_service.get_order_by_id(db, order_id)
     
     if not order:
         raise HTTPException(
@@ -36,20 +89,31 @@ def get_order(order_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("", response_model=OrderResponse, status_code=status.HTTP_201_CREATED)
-def create_order(order_data: OrderCreate, db: Session = Depends(get_db)):
+async def create_order(order_data: OrderCreate, db: AsyncSession = Depends(get_db)):
     """Создать новый заказ"""
-    order = order_service.create_order(db, order_data)
+    order = await order_service.create_order(db, order_data)
     return order
 
 
+@router.post("/bulk", response_model=OrderBulkResponse)
+async def create_orders_bulk(rows: List[Any] = Body(...), db: AsyncSession = Depends(get_db)):
+    """
+    Создать заказы пакетом: каждая строка проверяется отдельно, корректные
+    вставляются многострочными INSERT ... RETURNING. Ошибки - по индексам строк.
+    """
+    valid, errors = validate_rows(rows, OrderCreate)
+    created, insert_errors = await order_service.create_orders_bulk(db, valid)
+    return {"created": created, "errors": sorted(errors + insert_errors, key=lambda error: error["index"])}
+
+
 @router.put("/{order_id}", response_model=OrderResponse)
-def update_order(
+async def update_order(
     order_id: int,
     order_data: OrderUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить заказ"""
-    order = order_service.update_order(db, order_id, order_data)
+    order = await order_service.update_order(db, order_id, order_data)
     
     if not order:
         raise HTTPException(
@@ -61,9 +125,9 @@ def update_order(
 
 
 @router.delete("/{order_id}")
-def delete_order(order_id: int, db: Session = Depends(get_db)):
+async def delete_order(order_id: int, db: AsyncSession = Depends(get_db)):
     """Удалить заказ"""
-    order = order_service.delete_order(db, order_id)
+    order = await order_service.delete_order(db, order_id)
     
     if not order:
         raise HTTPException(
@@ -83,13 +147,13 @@ def delete_order(order_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/status")
-def status():
+async def status_check():
     """Status endpoint"""
     return {"status": "Orders service is running"}
 
 
 @router.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
     return {
         "status": "OK",
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Any, List, Optional
 
 
 class OrderBase(BaseModel):
@@ -29,3 +29,15 @@ class OrderResponse(OrderBase):
     
     class Config:
         from_attributes = True
+
+
+class BulkError(BaseModel):
+    """Ошибка строки пакетного создания"""
+    index: int
+    detail: Any
+
+
+class OrderBulkResponse(BaseModel):
+    """Результат пакетного создания заказов"""
+    created: List[OrderResponse]
+    errors: List[BulkError]
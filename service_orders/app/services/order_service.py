@@ -1,68 +1,136 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List, Tuple
+from datetime import datetime
+import asyncio
 from ..models import Order
 from ..schemas import OrderCreate, OrderUpdate
 from ..redis_client import redis_client
+from ..pagination import paginate, next_cursor
+from ..bulk import insert_chunks
+from ..group_commit import GroupCommitter, group_commit_config
 
 
 class OrderService:
     """Сервис для работы с заказами"""
     
     @staticmethod
-    def get_order_by_id(db: Session, order_id: int) -> Optional[dict]:
+    def _order_to_dict(order: Order) -> dict:
+        return {
+            "id": order.id,
+            "userId": order.userId,
+            "product": order.product,
+            "quantity": order.quantity,
+            "created_at": order.created_at.isoformat()
+        }
+    
+    @staticmethod
+    async def get_order_by_id(db: AsyncSession, order_id: int) -> Optional[dict]:
         """Получить заказ по ID с использованием кэша"""
         cache_key = f"order:{order_id}"
         
         # Проверяем кэш
-        cached_order = redis_client.get(cache_key)
+        cached_order = await redis_client.get(cache_key)
         if cached_order:
             print(f"✅ Cache HIT for {cache_key}")
             return cached_order
         
         # Запрос в БД
         print(f"❌ Cache MISS for {cache_key}")
-        order = db.query(Order).filter(Order.id == order_id).first()
+        order = await db.get(Order, order_id)
         
         if not order:
             return None
         
         # Преобразуем в dict и сохраняем в кэш
-        order_dict = {
-            "id": order.id,
-            "userId": order.userId,
-            "product": order.product,
-            "quantity": order.quantity,
-            "created_at": order.created_at.isoformat()
-        }
+        order_dict = OrderService._order_to_dict(order)
         
         # Сохраняем в кэш на 5 минут
-        redis_client.set(cache_key, order_dict, expire=300)
+        await redis_client.set(cache_key, order_dict, expire=300)
         
         return order_dict
     
     @staticmethod
-    def get_all_orders(db: Session, user_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[Order]:
-        """Получить список заказов с фильтрацией по userId"""
-        query = db.query(Order)
+    async def get_orders_by_ids(db: AsyncSession, order_ids: List[int]) -> List[dict]:
+        """
+        Получить несколько заказов: один MGET, промахи одним IN запросом,
+        догрузка кэша одним pipeline. Порядок - как в order_ids.
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+        cached = await redis_client.mget([f"order:{order_id}" for order_id in order_ids])
+        found = {order_id: order for order_id, order in zip(order_ids, cached) if order is not None}
+        
+        missing = [order_id for order_id in order_ids if order_id not in found]
+        if missing:
+            loaded = {
+                order.id: OrderService._order_to_dict(order)
+                for order in (await db.scalars(select(Order).where(Order.id.in_(missing)))).all()
+            }
+            await redis_client.set_many(
+                {f"order:{order_id}": order for order_id, order in loaded.items()}, expire=300
+            )
+            found.update(loaded)
+        
+        print(f"📦 Batch lookup: {len(order_ids) - len(missing)} cached, {len(missing)} from DB")
+        return [found[order_id] for order_id in order_ids if order_id in found]
+    
+    @staticmethod
+    async def get_all_orders(
+        db: AsyncSession,
+        user_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        skip: int = 0
+    ) -> Tuple[List[Order], Optional[str]]:
+        """Страница заказов с фильтрацией по userId и курсор следующей страницы"""
+        query = select(Order)
+        columns = (Order.created_at, Order.id)
         
         if user_id is not None:
-            query = query.filter(Order.userId == user_id)
+            query = query.where(Order.userId == user_id)
+            columns = (Order.userId, Order.id)
         
-        return query.offset(skip).limit(limit).all()
+        orders = (await db.scalars(paginate(query, columns, cursor, limit).offset(skip))).all()
+        return orders, next_cursor(orders, columns, limit)
     
     @staticmethod
-    def create_order(db: Session, order_data: OrderCreate) -> Order:
-        """Создать новый заказ"""
+    def export_query(
+        user_id: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None
+    ):
+        """Запрос выгрузки: колонки таблицы без ORM объектов, порядок как у списка"""
+        query = select(*Order.__table__.columns)
+        columns = (Order.created_at, Order.id)
+        if user_id is not None:
+            query = query.where(Order.userId == user_id)
+            columns = (Order.userId, Order.id)
+        if created_from is not None:
+            query = query.where(Order.created_at >= created_from)
+        if created_to is not None:
+            query = query.where(Order.created_at < created_to)
+        return query.order_by(*columns)
+    
+    @staticmethod
+    async def create_order(db: AsyncSession, order_data: OrderCreate) -> Order:
+        """Создать новый заказ (с GROUP_COMMIT_ENABLED - в общей транзакции с конкурентными)"""
+        if group_commit_config.enabled:
+            return await order_committer.submit(order_data.model_dump())
         order = Order(**order_data.model_dump())
         db.add(order)
-        db.commit()
-        db.refresh(order)
+        await db.commit()
+        await db.refresh(order)
         return order
     
     @staticmethod
-    def update_order(db: Session, order_id: int, order_data: OrderUpdate) -> Optional[Order]:
+    async def create_orders_bulk(db: AsyncSession, rows: List[Tuple[int, OrderCreate]]) -> Tuple[List[dict], List[dict]]:
+        """Создать заказы пакетом (многострочный INSERT ... RETURNING на кусок)"""
+        return await insert_chunks(db, Order, [(index, order_data.model_dump()) for index, order_data in rows])
+    
+    @staticmethod
+    async def update_order(db: AsyncSession, order_id: int, order_data: OrderUpdate) -> Optional[Order]:
         """Обновить заказ с инвалидацией кэша"""
-        order = db.query(Order).filter(Order.id == order_id).first()
+        order = await db.get(Order, order_id)
         
         if not order:
             return None
@@ -71,31 +139,34 @@ class OrderService:
         for key, value in update_data.items():
             setattr(order, key, value)
         
-        db.commit()
-        db.refresh(order)
+        await db.commit()
         
-        # Инвалидируем кэш
-        redis_client.delete(f"order:{order_id}")
+        # Инвалидируем кэш параллельно с перечитыванием записи из БД
+        await asyncio.gather(
+            db.refresh(order),
+            redis_client.delete(f"order:{order_id}")
+        )
         print(f"🗑️  Cache invalidated for order:{order_id}")
         
         return order
     
     @staticmethod
-    def delete_order(db: Session, order_id: int) -> Optional[Order]:
+    async def delete_order(db: AsyncSession, order_id: int) -> Optional[Order]:
         """Удалить заказ с инвалидацией кэша"""
-        order = db.query(Order).filter(Order.id == order_id).first()
+        order = await db.get(Order, order_id)
         
         if not order:
             return None
         
-        db.delete(order)
-        db.commit()
+        await db.delete(order)
+        await db.commit()
         
         # Инвалидируем кэш
-        redis_client.delete(f"order:{order_id}")
+        await redis_client.delete(f"order:{order_id}")
         print(f"🗑️  Cache invalidated for order:{order_id}")
         
         return order
 
 
+order_committer = GroupCommitter(Order, group_commit_config)
 order_service = OrderService()
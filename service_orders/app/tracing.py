@@ -0,0 +1,246 @@
+import atexit
+import contextvars
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List, Optional
+
+
+# Tracing configuration
+class TracingConfig:
+    def __init__(self):
+        # Доля трасс, которые записываются (решение принимается на входе и передаётся дальше)
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", 0.1))
+        # Кольцевой буфер последних спанов для /debug/traces
+        self.buffer_size = int(os.getenv("TRACE_BUFFER_SIZE", 2000))
+        # JSON lines файл с ротацией (пусто - не писать)
+        self.file_path = os.getenv("TRACE_FILE", "")
+        self.file_max_bytes = int(os.getenv("TRACE_FILE_MAX_BYTES", 10 * 1024 * 1024))
+        self.file_backups = int(os.getenv("TRACE_FILE_BACKUPS", 3))
+        self.batch_size = int(os.getenv("TRACE_BATCH_SIZE", 256))
+        self.flush_interval = float(os.getenv("TRACE_FLUSH_INTERVAL", 1.0))
+
+
+# W3C trace context: version-trace_id-parent_id-flags
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Текущий спан запроса (копируется в threadpool и asyncio задачи)
+current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_id, sampled) или None для отсутствующего/битого заголовка"""
+    if not header:
+        return None
+    match = TRACEPARENT_RE.match(header.strip().lower())
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class Span:
+    __slots__ = (
+        "tracer", "name", "kind", "trace_id", "span_id", "parent_id", "sampled",
+        "attributes", "error", "start_time", "_started",
+    )
+
+    def __init__(self, tracer, name, kind, trace_id, parent_id, sampled, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def finish(self):
+        if not self.sampled:
+            return
+        self.tracer.exporter.export({
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.tracer.service_name,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start_time,
+            "duration_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "error": self.error,
+            "attributes": self.attributes,
+        })
+
+
+class SpanExporter:
+    """
+    Экспорт спанов: кольцевой буфер в памяти и (опционально) JSON lines файл
+
+    Запись в файл идёт пачками из фонового потока, так что в обработке
+    запроса остаются только два append в deque.
+    """
+
+    def __init__(self, config: TracingConfig):
+        self.config = config
+        self.buffer: deque = deque(maxlen=config.buffer_size)
+        self.exported = 0
+        self._pending: deque = deque()
+        self._wake = threading.Event()
+        if config.file_path:
+            threading.Thread(target=self._run, name="span-exporter", daemon=True).start()
+            atexit.register(self.flush)
+
+    def export(self, record: dict):
+        self.exported += 1
+        self.buffer.append(record)
+        if self.config.file_path:
+            self._pending.append(record)
+            if len(self._pending) >= self.config.batch_size:
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.config.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"⚠️  Trace export error: {e}")
+
+    def flush(self):
+        lines = []
+        while self._pending:
+            lines.append(json.dumps(self._pending.popleft(), default=str))
+        if not lines:
+            return
+        data = "\n".join(lines) + "\n"
+        path = self.config.file_path
+        if os.path.exists(path) and os.path.getsize(path) + len(data) > self.config.file_max_bytes:
+            self._rotate(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(data)
+
+    def _rotate(self, path: str):
+        for index in range(self.config.file_backups - 1, 0, -1):
+            if os.path.exists(f"{path}.{index}"):
+                os.replace(f"{path}.{index}", f"{path}.{index + 1}")
+        if self.config.file_backups > 0:
+            os.replace(path, f"{path}.1")
+        else:
+            os.remove(path)
+
+    def recent(self, trace_id: Optional[str] = None, limit: int = 100) -> List[dict]:
+        spans = [s for s in list(self.buffer) if trace_id is None or s["trace_id"] == trace_id]
+        return spans[-limit:][::-1]
+
+
+class Tracer:
+    """
+    Head-based sampling: решение принимается для входящего запроса (или берётся
+    из traceparent вызывающего) и наследуется всеми дочерними спанами.
+    Для несэмплированных запросов дочерние спаны не создаются вовсе.
+    """
+
+    def __init__(self, config: TracingConfig):
+        self.config = config
+        self.service_name = "app"
+        self.exporter = SpanExporter(config)
+
+    def start_server_span(self, name: str, traceparent: Optional[str]) -> Span:
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = random.random() < self.config.sample_rate
+        return Span(self, name, "server", trace_id, parent_id, sampled, {})
+
+    def start_span(self, name: str, kind: str = "internal", **attributes) -> Optional[Span]:
+        """Дочерний спан текущего; None, если трасса не сэмплирована"""
+        parent = current_span.get()
+        if parent is None or not parent.sampled:
+            return None
+        return Span(self, name, kind, parent.trace_id, parent.span_id, True, attributes)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        span = self.start_span(name, kind, **attributes)
+        if span is None:
+            yield None
+            return
+        token = current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            current_span.reset(token)
+            span.finish()
+
+    def traceparent(self, span: Optional[Span] = None) -> Optional[str]:
+        """Заголовок для исходящего запроса (передаётся и для несэмплированных трасс)"""
+        span = span or current_span.get()
+        return span.traceparent if span is not None else None
+
+
+# Глобальный трассировщик процесса
+tracer = Tracer(TracingConfig())
+
+
+class TraceMiddleware:
+    """ASGI middleware: серверный спан на каждый запрос, контекст из traceparent"""
+
+    def __init__(self, app, service_name: str):
+        self.app = app
+        tracer.service_name = service_name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+        span = tracer.start_server_span(scope["method"], traceparent)
+        trace_header = (b"x-trace-id", span.trace_id.encode())
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                message["headers"] = list(message.get("headers", [])) + [trace_header]
+            await send(message)
+
+        token = current_span.set(span)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            current_span.reset(token)
+            route = scope.get("metrics_route")
+            if route is None:
+                route = getattr(scope.get("route"), "path", None) or scope["path"]
+            span.name = f"{scope['method']} {route}"
+            span.set_attribute("http.target", scope["path"])
+            span.finish()
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Тесты работают с отдельной SQLite базой; переменная читается при импорте app.database
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'orders_test.db')}"
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,100 @@
+import asyncio
+
+from sqlalchemy.exc import IntegrityError
+
+from app.database import engine, init_db
+from app.group_commit import GroupCommitConfig, GroupCommitter
+from app.models import Order
+
+
+def make_committer(**overrides) -> GroupCommitter:
+    config = GroupCommitConfig()
+    config.max_batch = 100
+    config.max_wait = 0.01
+    config.max_in_flight = 1
+    for name, value in overrides.items():
+        setattr(config, name, value)
+    return GroupCommitter(Order, config)
+
+
+def counting_inserts(committer: GroupCommitter) -> list:
+    """Размеры транзакций, выполненных committer"""
+    sizes = []
+    insert = committer._insert
+
+    async def counted(rows):
+        sizes.append(len(rows))
+        return await insert(rows)
+
+    committer._insert = counted
+    return sizes
+
+
+def run(scenario):
+    async def wrapper():
+        await init_db()
+        try:
+            await scenario()
+        finally:
+            await engine.dispose()
+
+    asyncio.run(wrapper())
+
+
+def order(user_id, product="Book"):
+    return {"userId": user_id, "product": product, "quantity": 1}
+
+
+def test_concurrent_submits_share_one_transaction():
+    async def scenario():
+        committer = make_committer()
+        sizes = counting_inserts(committer)
+        rows = await asyncio.gather(*(committer.submit(order(user_id)) for user_id in range(10)))
+        assert sizes == [10]
+        # Каждый вызывающий получает свою строку
+        assert [row["userId"] for row in rows] == list(range(10))
+        assert len({row["id"] for row in rows}) == 10
+
+    run(scenario)
+
+
+def test_max_batch_flushes_without_waiting():
+    async def scenario():
+        committer = make_committer(max_batch=4, max_wait=10, max_in_flight=2)
+        sizes = counting_inserts(committer)
+        rows = await asyncio.wait_for(
+            asyncio.gather(*(committer.submit(order(user_id)) for user_id in range(8))), 5
+        )
+        assert sizes == [4, 4]
+        assert len(rows) == 8
+
+    run(scenario)
+
+
+def test_failed_batch_is_retried_row_by_row():
+    async def scenario():
+        committer = make_committer()
+        sizes = counting_inserts(committer)
+        results = await asyncio.gather(
+            committer.submit(order(1)),
+            committer.submit(order(None)),
+            committer.submit(order(3)),
+            return_exceptions=True,
+        )
+        assert sizes == [3, 1, 1, 1]
+        assert results[0]["userId"] == 1 and results[2]["userId"] == 3
+        assert isinstance(results[1], IntegrityError)
+
+    run(scenario)
+
+
+def test_close_flushes_queued_rows():
+    async def scenario():
+        committer = make_committer(max_wait=10)
+        pending = asyncio.ensure_future(committer.submit(order(7)))
+        await asyncio.sleep(0)
+        assert committer.queue
+        await committer.close()
+        assert (await pending)["userId"] == 7
+
+    run(scenario)
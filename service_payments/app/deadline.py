@@ -0,0 +1,100 @@
+import contextvars
+import json
+import os
+import time
+from typing import Optional
+
+from fastapi import HTTPException
+
+
+# Оставшийся бюджет запроса в миллисекундах (выставляет gateway).
+# Передаётся относительным, чтобы не зависеть от расхождения часов.
+DEADLINE_HEADER = b"x-request-timeout-ms"
+
+# Запросы с меньшим остатком бюджета отклоняются сразу
+MIN_BUDGET = float(os.getenv("DEADLINE_MIN_BUDGET_MS", 5)) / 1000
+
+# Дедлайн текущего запроса по time.monotonic() (копируется в threadpool)
+request_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "request_deadline", default=None
+)
+
+
+def remaining() -> Optional[float]:
+    """Секунды до дедлайна или None, если дедлайна нет"""
+    deadline = request_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def check():
+    """504, если вызывающий уже не ждёт ответа"""
+    budget = remaining()
+    if budget is not None and budget <= 0:
+        raise HTTPException(status_code=504, detail="Deadline exceeded")
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware: дедлайн запроса из заголовка gateway
+
+    Просроченные запросы отклоняются с 504 до выполнения обработчика;
+    ошибка, случившаяся после дедлайна (отмена запроса Postgres по
+    statement_timeout, таймаут Redis), тоже отдаётся как 504.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        budget = None
+        for name, value in scope["headers"]:
+            if name == DEADLINE_HEADER:
+                try:
+                    budget = float(value) / 1000
+                except ValueError:
+                    pass
+                break
+        if budget is None:
+            await self.app(scope, receive, send)
+            return
+
+        if budget < MIN_BUDGET:
+            await self._deadline_exceeded(send)
+            return
+
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = request_deadline.set(time.monotonic() + budget)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            if started or remaining() > 0:
+                raise
+            await self._deadline_exceeded(send)
+        finally:
+            request_deadline.reset(token)
+
+    @staticmethod
+    async def _deadline_exceeded(send):
+        body = json.dumps({"detail": "Deadline exceeded"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 504,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import insert
+
+from . import deadline
+from .database import SessionLocal
+from .metrics import registry
+
+GROUP_COMMIT_BATCH_SIZE = registry.histogram(
+    "group_commit_batch_size",
+    "Rows inserted by one group commit transaction",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+GROUP_COMMIT_QUEUE_DELAY = registry.histogram(
+    "group_commit_queue_delay_seconds",
+    "Time a create call waits for its group commit batch to start",
+)
+GROUP_COMMIT_FALLBACKS = registry.counter(
+    "group_commit_fallbacks_total",
+    "Failed group commit batches retried row by row",
+)
+
+
+# Group commit configuration
+class GroupCommitConfig:
+    def __init__(self):
+        self.enabled = os.getenv("GROUP_COMMIT_ENABLED", "false").lower() in ("1", "true", "yes", "on")
+        # Пакет уходит в БД, как только набралось max_batch строк
+        self.max_batch = int(os.getenv("GROUP_COMMIT_MAX_BATCH", 100))
+        # ... или через max_wait после первой строки пакета
+        self.max_wait = float(os.getenv("GROUP_COMMIT_MAX_WAIT_MS", 2)) / 1000
+        # Пакетов в работе одновременно; пока они пишутся, копится следующий
+        self.max_in_flight = int(os.getenv("GROUP_COMMIT_MAX_IN_FLIGHT", 1))
+
+
+group_commit_config = GroupCommitConfig()
+
+
+class GroupCommitter:
+    """
+    Group commit: конкурентные вставки одной таблицы - одной транзакцией
+
+    submit() ставит строку в очередь; пакет пишется одним многострочным
+    INSERT ... RETURNING, и каждый вызывающий получает свою строку.
+    Пока пишутся max_in_flight пакетов, новые строки ждут в очереди и
+    уходят следующим пакетом сразу после коммита. Если транзакция пакета
+    не удалась, строки повторяются по одной, чтобы ошибка досталась
+    только виновной строке.
+    """
+
+    def __init__(self, model, config: GroupCommitConfig):
+        self.table = model.__table__
+        self.config = config
+        self.queue: List[Tuple[Dict[str, Any], asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.in_flight = 0
+
+    async def submit(self, values: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.append((values, future, time.perf_counter()))
+        if len(self.queue) >= self.config.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.config.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self.queue and self.in_flight < self.config.max_in_flight:
+            batch = self.queue[:self.config.max_batch]
+            del self.queue[:self.config.max_batch]
+            self.in_flight += 1
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        self.in_flight -= 1
+        # Строки, накопленные за время записи, уходят без ожидания max_wait
+        if self.queue:
+            self._flush()
+
+    async def _insert(self, rows: List[Dict[str, Any]]) -> list:
+        async with SessionLocal() as db:
+            result = await db.execute(
+                insert(self.table).returning(*self.table.columns, sort_by_parameter_order=True),
+                rows
+            )
+            created = result.mappings().all()
+            await db.commit()
+        return created
+
+    async def _run(self, batch: List[Tuple[Dict[str, Any], asyncio.Future, float]]):
+        # Пакет общий для нескольких запросов: дедлайн первого из них не применяется
+        deadline.request_deadline.set(None)
+        started = time.perf_counter()
+        GROUP_COMMIT_BATCH_SIZE.observe(len(batch))
+        for _, _, enqueued_at in batch:
+            GROUP_COMMIT_QUEUE_DELAY.observe(started - enqueued_at)
+
+        if len(batch) == 1:
+            await self._run_single(batch[0])
+            return
+        try:
+            created = await self._insert([values for values, _, _ in batch])
+        except Exception:
+            GROUP_COMMIT_FALLBACKS.inc()
+            for item in batch:
+                await self._run_single(item)
+            return
+        for (_, future, _), row in zip(batch, created):
+            if not future.done():
+                future.set_result(row)
+
+    async def _run_single(self, item: Tuple[Dict[str, Any], asyncio.Future, float]):
+        values, future, _ = item
+        try:
+            row = (await self._insert([values]))[0]
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(row)
+
+    async def close(self):
+        """Записать накопленные строки и дождаться пакетов в работе"""
+        self._flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
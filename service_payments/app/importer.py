@@ -0,0 +1,159 @@
+"""
+Офлайн импорт CSV / NDJSON в таблицу сервиса
+
+    python -m app.importer users.csv
+    python -m app.importer orders.ndjson --batch-size 20000
+
+В Postgres строки загружаются одним COPY (бинарный протокол asyncpg),
+в SQLite - executemany пачками. Колонки, которых нет в файле, получают
+значения по умолчанию модели; id, если не указан, выдаёт БД.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List
+
+from sqlalchemy import Table, text
+
+from .database import Base, engine, init_db
+from . import models  # noqa: F401 - регистрирует таблицы в Base.metadata
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Строки файла по одной (формат - по расширению: .csv или .ndjson/.jsonl)"""
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {name: (value if value != "" else None) for name, value in row.items()}
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _converter(column):
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return lambda value: value if isinstance(value, datetime) else datetime.fromisoformat(value)
+    return lambda value: value if isinstance(value, python_type) else python_type(value)
+
+
+def _default(column):
+    default = column.default
+    if default is None:
+        return None
+    if default.is_callable:
+        return lambda: default.arg(None)
+    return lambda: default.arg
+
+
+class RecordConverter:
+    """Словарь из файла -> кортеж значений колонок таблицы в их Python типах"""
+
+    def __init__(self, table: Table, fields: List[str]):
+        unknown = set(fields) - set(table.columns.keys())
+        if unknown:
+            raise SystemExit(f"❌ Unknown columns for {table.name}: {', '.join(sorted(unknown))}")
+        self.columns = [
+            column for column in table.columns
+            if column.name in fields or (not column.primary_key and column.default is not None)
+        ]
+        self.names = [column.name for column in self.columns]
+        self.converters = [_converter(column) for column in self.columns]
+        self.defaults = [_default(column) for column in self.columns]
+
+    def __call__(self, record: Dict[str, Any]) -> tuple:
+        values = []
+        for name, convert, default in zip(self.names, self.converters, self.defaults):
+            value = record.get(name)
+            if value is None:
+                values.append(default() if default is not None else None)
+            else:
+                values.append(convert(value))
+        return tuple(values)
+
+
+async def copy_postgres(table: Table, convert: RecordConverter, records: Iterator[dict]) -> int:
+    """Один COPY ... FROM STDIN (binary) на весь файл"""
+    count = 0
+
+    def rows():
+        nonlocal count
+        for record in records:
+            count += 1
+            yield convert(record)
+
+    async with engine.begin() as conn:
+        raw = await conn.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            table.name, records=rows(), columns=convert.names
+        )
+        if "id" in convert.names:
+            # id взяты из файла - сдвигаем последовательность за максимальный
+            await conn.execute(text(
+                f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                f"(SELECT COALESCE(MAX(id), 1) FROM {table.name}))"
+            ))
+    return count
+
+
+async def insert_batches(table: Table, convert: RecordConverter, records: Iterator[dict], batch_size: int) -> int:
+    """executemany пачками по batch_size строк (SQLite и прочие БД без COPY)"""
+    count = 0
+    async with engine.begin() as conn:
+        batch: List[dict] = []
+        for record in records:
+            batch.append(dict(zip(convert.names, convert(record))))
+            if len(batch) >= batch_size:
+                await conn.execute(table.insert(), batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            await conn.execute(table.insert(), batch)
+            count += len(batch)
+    return count
+
+
+async def run(path: str, table_name: str, batch_size: int):
+    await init_db()
+    table = Base.metadata.tables[table_name]
+    records = read_records(path)
+    first = next(records, None)
+    if first is None:
+        print(f"⚠️  {path} is empty")
+        return
+
+    def all_records():
+        yield first
+        yield from records
+
+    convert = RecordConverter(table, list(first))
+    started = time.perf_counter()
+    if engine.dialect.name == "postgresql":
+        count = await copy_postgres(table, convert, all_records())
+    else:
+        count = await insert_batches(table, convert, all_records(), batch_size)
+    elapsed = time.perf_counter() - started
+    print(f"✅ Imported {count} rows into {table.name} in {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+    await engine.dispose()
+
+
+def main():
+    tables = sorted(Base.metadata.tables)
+    parser = argparse.ArgumentParser(description="Import CSV / NDJSON into the service database")
+    parser.add_argument("path", help="файл .csv или .ndjson")
+    parser.add_argument("--table", default=tables[0], choices=tables)
+    parser.add_argument(
+        "--batch-size", type=int, default=int(os.getenv("IMPORT_BATCH_SIZE", 10000)),
+        help="строк в одном executemany (без COPY)"
+    )
+    args = parser.parse_args()
+    asyncio.run(run(args.path, args.table, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, Index
 from datetime import datetime
 import enum
 from .database import Base
@@ -14,6 +14,11 @@ class PaymentStatus(str, enum.Enum):
 class Payment(Base):
     """Модель платежа в базе данных"""
     __tablename__ = "payments"
+    __table_args__ = (
+        # Keyset пагинация: весь список по (created_at, id), платежи заказа по (order_id, id)
+        Index("ix_payments_created_at_id", "created_at", "id"),
+        Index("ix_payments_order_id_id", "order_id", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, index=True, nullable=False)
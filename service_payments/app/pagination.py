@@ -0,0 +1,62 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, Response, status
+from sqlalchemy import bindparam, tuple_
+
+
+# Курсор следующей страницы (пусто - страница последняя)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Ключ последней строки страницы -> непрозрачный курсор"""
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> List[Any]:
+    """Курсор -> значения ключа в типах колонок (422 при некорректном курсоре)"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError(cursor)
+        return [
+            datetime.fromisoformat(value) if column.type.python_type is datetime else value
+            for column, value in zip(columns, values)
+        ]
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Invalid cursor"
+        )
+
+
+def paginate(query, columns: Sequence, cursor: Optional[str], limit: int):
+    """
+    Keyset пагинация: ORDER BY columns и WHERE (columns) > ключ из курсора
+
+    Стоимость страницы не зависит от глубины (индекс по columns), а
+    вставки не сдвигают уже пройденные страницы.
+    """
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        query = query.where(tuple_(*columns) > tuple_(*(
+            bindparam(None, value, type_=column.type) for column, value in zip(columns, values)
+        )))
+    return query.order_by(*columns).limit(limit)
+
+
+def next_cursor(rows: Sequence, columns: Sequence, limit: int) -> Optional[str]:
+    """Курсор после последней строки (None, если страница неполная)"""
+    if not rows or len(rows) < limit:
+        return None
+    return encode_cursor([getattr(rows[-1], column.key) for column in columns])
+
+
+def set_next_cursor(response: Response, cursor: Optional[str]):
+    if cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = cursor
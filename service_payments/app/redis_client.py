@@ -1,63 +1,251 @@
-import redis
+import redis.asyncio as redis
+import asyncio
 import json
 import os
-from typing import Optional, Any
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from . import deadline
+from .metrics import registry
+from .tracing import tracer
+
+# Обращения к кэшу: get -> hit/miss/error, set/delete -> ok/error, disabled без Redis,
+# skipped - бюджет запроса исчерпан
+CACHE_OPERATIONS = registry.counter(
+    "cache_operations_total",
+    "Redis cache operations by result",
+    ("operation", "result"),
+)
+
+
+class InMemoryRedis:
+    """
+    Кэш в памяти процесса вместо Redis (встроенный режим): подмножество
+    интерфейса redis.asyncio.Redis, которое использует RedisClient
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._data: OrderedDict = OrderedDict()
+
+    def _get(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def _setex(self, key: str, expire: int, value: str) -> bool:
+        self._data[key] = (time.monotonic() + expire, value)
+        self._data.move_to_end(key)
+        # Самые давно использованные ключи вытесняются первыми
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+        return True
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._get(key)
+
+    async def mget(self, keys: List[str]) -> List[Optional[str]]:
+        return [self._get(key) for key in keys]
+
+    async def setex(self, key: str, expire: int, value: str) -> bool:
+        return self._setex(key, expire, value)
+
+    async def delete(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def pipeline(self, transaction: bool = True) -> "_InMemoryPipeline":
+        return _InMemoryPipeline(self)
+
+    async def ping(self) -> bool:
+        return True
+
+    async def aclose(self):
+        pass
+
+
+class _InMemoryPipeline:
+    def __init__(self, client: InMemoryRedis):
+        self.client = client
+        self.commands = []
+
+    def setex(self, key: str, expire: int, value: str):
+        self.commands.append((key, expire, value))
+        return self
+
+    async def execute(self) -> list:
+        return [self.client._setex(*command) for command in self.commands]
 
 
 class RedisClient:
-    """Клиент для работы с Redis"""
-    
+    """
+    Асинхронный клиент для работы с Redis
+
+    Соединения берутся из общего пула (REDIS_MAX_CONNECTIONS); при
+    исчерпании пула операция ждёт свободное соединение не дольше
+    REDIS_POOL_TIMEOUT. Если Redis недоступен при старте, кэш выключен
+    (available = False) и операции сразу возвращают промах.
+    """
+
     def __init__(self):
+        self.available = False
+        self.socket_timeout = float(os.getenv("REDIS_SOCKET_TIMEOUT", 2))
+        if os.getenv("CACHE_BACKEND", "redis") == "memory":
+            self.client = InMemoryRedis(int(os.getenv("CACHE_MEMORY_MAX_KEYS", 10000)))
+            return
+        self.pool = redis.BlockingConnectionPool(
+            host=os.getenv('REDIS_HOST', 'cache'),
+            port=int(os.getenv('REDIS_PORT', 6379)),
+            decode_responses=True,
+            socket_timeout=self.socket_timeout,
+            socket_connect_timeout=self.socket_timeout,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+            timeout=float(os.getenv("REDIS_POOL_TIMEOUT", 1.0))
+        )
+        self.client = redis.Redis(connection_pool=self.pool)
+
+    async def connect(self):
+        """Проверить соединение при старте сервиса"""
         try:
-            self.client = redis.Redis(
-                host=os.getenv('REDIS_HOST', 'cache'),
-                port=int(os.getenv('REDIS_PORT', 6379)),
-                decode_responses=True,
-                socket_timeout=2,
-                socket_connect_timeout=2
-            )
-            self.client.ping()
+            await self.client.ping()
             self.available = True
         except redis.RedisError:
             print("⚠️  Redis not available - caching disabled")
             self.available = False
-    
-    def get(self, key: str) -> Optional[dict]:
+
+    async def close(self):
+        await self.client.aclose()
+
+    def _timeout(self) -> Optional[float]:
+        """
+        Таймаут операции не больше оставшегося бюджета запроса;
+        None - бюджет исчерпан, обращаться к Redis нет смысла
+        """
+        budget = deadline.remaining()
+        if budget is None:
+            return self.socket_timeout
+        return min(budget, self.socket_timeout) if budget > 0 else None
+
+    async def get(self, key: str) -> Optional[dict]:
         if not self.available:
+            CACHE_OPERATIONS.labels("get", "disabled").inc()
+            return None
+        timeout = self._timeout()
+        if timeout is None:
+            CACHE_OPERATIONS.labels("get", "skipped").inc()
             return None
         try:
-            data = self.client.get(key)
+            with tracer.span("redis GET", kind="client", key=key):
+                data = await asyncio.wait_for(self.client.get(key), timeout)
             if data:
-                return json.loads(data)
-        except (redis.RedisError, json.JSONDecodeError) as e:
-            print(f"Redis get error: {e}")
+                value = json.loads(data)
+                CACHE_OPERATIONS.labels("get", "hit").inc()
+                return value
+            CACHE_OPERATIONS.labels("get", "miss").inc()
+        except (redis.RedisError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+            CACHE_OPERATIONS.labels("get", "error").inc()
+            print(f"Redis get error: {e!r}")
         return None
-    
-    def set(self, key: str, value: Any, expire: int = 300) -> bool:
+
+    async def set(self, key: str, value: Any, expire: int = 300) -> bool:
         if not self.available:
+            CACHE_OPERATIONS.labels("set", "disabled").inc()
+            return False
+        timeout = self._timeout()
+        if timeout is None:
+            CACHE_OPERATIONS.labels("set", "skipped").inc()
             return False
         try:
-            self.client.setex(key, expire, json.dumps(value, default=str))
+            with tracer.span("redis SETEX", kind="client", key=key):
+                await asyncio.wait_for(self.client.setex(key, expire, json.dumps(value, default=str)), timeout)
+            CACHE_OPERATIONS.labels("set", "ok").inc()
             return True
-        except (redis.RedisError, TypeError) as e:
-            print(f"Redis set error: {e}")
+        except (redis.RedisError, asyncio.TimeoutError, TypeError) as e:
+            CACHE_OPERATIONS.labels("set", "error").inc()
+            print(f"Redis set error: {e!r}")
             return False
-    
-    def delete(self, key: str) -> bool:
+
+    async def mget(self, keys: List[str]) -> List[Optional[Any]]:
+        """Получить несколько ключей одним MGET (None - промах)"""
+        if not keys:
+            return []
         if not self.available:
+            CACHE_OPERATIONS.labels("mget", "disabled").inc()
+            return [None] * len(keys)
+        timeout = self._timeout()
+        if timeout is None:
+            CACHE_OPERATIONS.labels("mget", "skipped").inc()
+            return [None] * len(keys)
+        try:
+            with tracer.span("redis MGET", kind="client", keys=len(keys)):
+                raw_values = await asyncio.wait_for(self.client.mget(keys), timeout)
+        except (redis.RedisError, asyncio.TimeoutError) as e:
+            CACHE_OPERATIONS.labels("mget", "error").inc()
+            print(f"Redis mget error: {e!r}")
+            return [None] * len(keys)
+        values = []
+        for raw in raw_values:
+            try:
+                values.append(json.loads(raw) if raw is not None else None)
+            except json.JSONDecodeError:
+                values.append(None)
+        hits = sum(1 for value in values if value is not None)
+        CACHE_OPERATIONS.labels("mget", "hit").inc(hits)
+        CACHE_OPERATIONS.labels("mget", "miss").inc(len(values) - hits)
+        return values
+
+    async def set_many(self, mapping: Dict[str, Any], expire: int = 300) -> bool:
+        """Сохранить несколько ключей одним pipeline (один round trip)"""
+        if not mapping:
+            return True
+        if not self.available:
+            CACHE_OPERATIONS.labels("set_many", "disabled").inc()
+            return False
+        timeout = self._timeout()
+        if timeout is None:
+            CACHE_OPERATIONS.labels("set_many", "skipped").inc()
+            return False
+        try:
+            with tracer.span("redis SETEX pipeline", kind="client", keys=len(mapping)):
+                pipe = self.client.pipeline(transaction=False)
+                for key, value in mapping.items():
+                    pipe.setex(key, expire, json.dumps(value, default=str))
+                await asyncio.wait_for(pipe.execute(), timeout)
+            CACHE_OPERATIONS.labels("set_many", "ok").inc()
+            return True
+        except (redis.RedisError, asyncio.TimeoutError, TypeError) as e:
+            CACHE_OPERATIONS.labels("set_many", "error").inc()
+            print(f"Redis set_many error: {e!r}")
+            return False
+
+    async def delete(self, *keys: str) -> bool:
+        """Удалить данные из кэша (несколько ключей - одной командой DEL)"""
+        if not self.available:
+            CACHE_OPERATIONS.labels("delete", "disabled").inc()
             return False
         try:
-            self.client.delete(key)
+            # Инвалидация после записи в БД выполняется без учёта дедлайна,
+            # иначе кэш останется устаревшим
+            with tracer.span("redis DEL", kind="client", key=" ".join(keys)):
+                await self.client.delete(*keys)
+            CACHE_OPERATIONS.labels("delete", "ok").inc()
             return True
         except redis.RedisError as e:
-            print(f"Redis delete error: {e}")
+            CACHE_OPERATIONS.labels("delete", "error").inc()
+            print(f"Redis delete error: {e!r}")
             return False
-    
-    def ping(self) -> bool:
+
+    async def ping(self) -> bool:
         if not self.available:
             return False
         try:
-            return self.client.ping()
+            return await self.client.ping()
         except redis.RedisError:
             return False
 
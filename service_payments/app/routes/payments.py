@@ -1,30 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi import APIRouter, Body, Depends, HTTPException, status, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List, Optional
+from datetime import datetime
+import os
 
 from ..database import get_db
-from ..schemas import PaymentCreate, PaymentUpdate, PaymentResponse
+from ..pagination import set_next_cursor
+from ..export import export_response
+from ..bulk import validate_rows
+from ..schemas import PaymentCreate, PaymentUpdate, PaymentResponse, PaymentBulkResponse
 from ..services.payment_service import payment_service
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
+# Максимум id в одном пакетном запросе
+MAX_BATCH_IDS = int(os.getenv("BATCH_LOOKUP_MAX_IDS", 100))
+
+
+def parse_ids(values: List[str]) -> List[int]:
+    """ids=1,2,3 и/или ids=1&ids=2 -> [1, 2, 3]"""
+    try:
+        ids = [int(part) for value in values for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be a comma-separated list of integers"
+        )
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_IDS} ids per request"
+        )
+    return ids
+
 
 @router.get("", response_model=List[PaymentResponse])
-def get_payments(
+async def get_payments(
+    response: Response,
     order_id: Optional[int] = Query(None),
+    order_ids: Optional[List[str]] = Query(None),
+    ids: Optional[List[str]] = Query(None),
+    cursor: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получить список платежей с фильтрацией по order_id"""
-    payments = payment_service.get_all_payments(db, order_id=order_id, skip=skip, limit=limit)
+    """
+    Получить список платежей с фильтрацией по order_id
+
+    ids - пакет платежей по id; order_ids - все платежи нескольких заказов
+    (оба варианта через MGET + один IN запрос, без пагинации).
+    Список упорядочен по (created_at, id), с order_id - по (order_id, id);
+    курсор следующей страницы возвращается в заголовке X-Next-Cursor.
+    """
+    if ids:
+        return await payment_service.get_payments_by_ids(db, parse_ids(ids))
+    if order_ids:
+        return await payment_service.get_payments_by_order_ids(db, parse_ids(order_ids))
+    payments, next_page = await payment_service.get_all_payments(
+        db, order_id=order_id, cursor=cursor, limit=limit, skip=skip
+    )
+    set_next_cursor(response, next_page)
     return payments
 
 
+@router.get("/export")
+async def export_payments(
+    format: str = "ndjson",
+    order_id: Optional[int] = Query(None),
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    """Потоковая выгрузка платежей (ndjson, csv или arrow) с фильтрами по order_id и created_at"""
+    return export_response(
+        payment_service.export_query(order_id=order_id, created_from=created_from, created_to=created_to),
+        format,
+        "payments"
+    )
+
+
 @router.get("/{payment_id}", response_model=PaymentResponse)
-def get_payment(payment_id: int, db: Session = Depends(get_db)):
+async def get_payment(payment_id: int, db: AsyncSession = Depends(get_db)):
     """Получить платеж по ID (с кэшированием)"""
-    payment = payment_service.get_payment_by_id(db, payment_id)
+    payment = await payment_service.get_payment_by_id(db, payment_id)
     
     if not payment:
         raise HTTPException(
@@ -36,24 +94,35 @@ def get_payment(payment_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("", response_model=PaymentResponse, status_code=status.HTTP_201_CREATED)
-def create_payment(payment_data: PaymentCreate, db: Session = Depends(get_db)):
+async def create_payment(payment_data: PaymentCreate, db: AsyncSession = Depends(get_db)):
     """
     Создать новый платеж с имитацией обработки
     
     Имитация: 30% шанс отказа (статус failed)
     """
-    payment = payment_service.create_payment(db, payment_data)
+    payment = await payment_service.create_payment(db, payment_data)
     return payment
 
 
+@router.post("/bulk", response_model=PaymentBulkResponse)
+async def create_payments_bulk(rows: List[Any] = Body(...), db: AsyncSession = Depends(get_db)):
+    """
+    Создать платежи пакетом: каждая строка проверяется отдельно, корректные
+    вставляются многострочными INSERT ... RETURNING. Ошибки - по индексам строк.
+    """
+    valid, errors = validate_rows(rows, PaymentCreate)
+    created, insert_errors = await payment_service.create_payments_bulk(db, valid)
+    return {"created": created, "errors": sorted(errors + insert_errors, key=lambda error: error["index"])}
+
+
 @router.put("/{payment_id}", response_model=PaymentResponse)
-def update_payment(
+async def update_payment(
     payment_id: int,
     payment_data: PaymentUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить статус платежа"""
-    payment = payment_service.update_payment(db, payment_id, payment_data)
+    payment = await payment_service.update_payment(db, payment_id, payment_data)
     
     if not payment:
         raise HTTPException(
@@ -65,9 +134,9 @@ def update_payment(
 
 
 @router.delete("/{payment_id}")
-def delete_payment(payment_id: int, db: Session = Depends(get_db)):
+async def delete_payment(payment_id: int, db: AsyncSession = Depends(get_db)):
     """Удалить платеж"""
-    payment = payment_service.delete_payment(db, payment_id)
+    payment = await payment_service.delete_payment(db, payment_id)
     
     if not payment:
         raise HTTPException(
@@ -87,13 +156,13 @@ def delete_payment(payment_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/status")
-def status_check():
+async def status_check():
     """Status endpoint"""
     return {"status": "Payments service is running"}
 
 
 @router.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
     return {
         "status": "OK",
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional
+from typing import Any, List, Optional
 from enum import Enum
 
 
@@ -36,3 +36,15 @@ class PaymentResponse(PaymentBase):
     
     class Config:
         from_attributes = True
+
+
+class BulkError(BaseModel):
+    """Ошибка строки пакетного создания"""
+    index: int
+    detail: Any
+
+
+class PaymentBulkResponse(BaseModel):
+    """Результат пакетного создания платежей"""
+    created: List[PaymentResponse]
+    errors: List[BulkError]
@@ -1,54 +1,140 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List, Tuple
+from datetime import datetime
+import asyncio
 import random
 from ..models import Payment, PaymentStatus
 from ..schemas import PaymentCreate, PaymentUpdate
 from ..redis_client import redis_client
+from ..pagination import paginate, next_cursor
+from ..bulk import insert_chunks
+from ..group_commit import GroupCommitter, group_commit_config
 
 
 class PaymentService:
     """Сервис для работы с платежами"""
     
     @staticmethod
-    def get_payment_by_id(db: Session, payment_id: int) -> Optional[dict]:
+    def _payment_to_dict(payment: Payment) -> dict:
+        return {
+            "id": payment.id,
+            "order_id": payment.order_id,
+            "amount": payment.amount,
+            "status": payment.status,
+            "created_at": payment.created_at.isoformat(),
+            "updated_at": payment.updated_at.isoformat()
+        }
+    
+    @staticmethod
+    async def get_payment_by_id(db: AsyncSession, payment_id: int) -> Optional[dict]:
         """Получить платеж по ID с кэшированием"""
         cache_key = f"payment:{payment_id}"
         
-        cached_payment = redis_client.get(cache_key)
+        cached_payment = await redis_client.get(cache_key)
         if cached_payment:
             print(f"✅ Cache HIT for {cache_key}")
             return cached_payment
         
         print(f"❌ Cache MISS for {cache_key}")
-        payment = db.query(Payment).filter(Payment.id == payment_id).first()
+        payment = await db.get(Payment, payment_id)
         
         if not payment:
             return None
         
-        payment_dict = {
-            "id": payment.id,
-            "order_id": payment.order_id,
-            "amount": payment.amount,
-            "status": payment.status,
-            "created_at": payment.created_at.isoformat(),
-            "updated_at": payment.updated_at.isoformat()
-        }
+        payment_dict = PaymentService._payment_to_dict(payment)
         
-        redis_client.set(cache_key, payment_dict, expire=300)
+        await redis_client.set(cache_key, payment_dict, expire=300)
         return payment_dict
     
     @staticmethod
-    def get_all_payments(db: Session, order_id: Optional[int] = None, skip: int = 0, limit: int = 100) -> List[Payment]:
-        """Получить список платежей с фильтрацией"""
-        query = db.query(Payment)
+    async def get_payments_by_ids(db: AsyncSession, payment_ids: List[int]) -> List[dict]:
+        """
+        Получить несколько платежей: один MGET, промахи одним IN запросом,
+        догрузка кэша одним pipeline. Порядок - как в payment_ids.
+        """
+        payment_ids = list(dict.fromkeys(payment_ids))
+        cached = await redis_client.mget([f"payment:{payment_id}" for payment_id in payment_ids])
+        found = {pid: payment for pid, payment in zip(payment_ids, cached) if payment is not None}
+        
+        missing = [pid for pid in payment_ids if pid not in found]
+        if missing:
+            loaded = {
+                payment.id: PaymentService._payment_to_dict(payment)
+                for payment in (await db.scalars(select(Payment).where(Payment.id.in_(missing)))).all()
+            }
+            await redis_client.set_many(
+                {f"payment:{pid}": payment for pid, payment in loaded.items()}, expire=300
+            )
+            found.update(loaded)
+        
+        print(f"📦 Batch lookup: {len(payment_ids) - len(missing)} cached, {len(missing)} from DB")
+        return [found[pid] for pid in payment_ids if pid in found]
+    
+    @staticmethod
+    async def get_payments_by_order_ids(db: AsyncSession, order_ids: List[int]) -> List[dict]:
+        """
+        Все платежи нескольких заказов
+
+        Кэшируется список платежей заказа (payments:order:{id}), в том числе
+        пустой; промахи загружаются одним запросом WHERE order_id IN (...).
+        """
+        order_ids = list(dict.fromkeys(order_ids))
+        cached = await redis_client.mget([f"payments:order:{order_id}" for order_id in order_ids])
+        by_order = {oid: payments for oid, payments in zip(order_ids, cached) if payments is not None}
+        
+        missing = [oid for oid in order_ids if oid not in by_order]
+        if missing:
+            loaded = {oid: [] for oid in missing}
+            for payment in (await db.scalars(select(Payment).where(Payment.order_id.in_(missing)))).all():
+                loaded[payment.order_id].append(PaymentService._payment_to_dict(payment))
+            await redis_client.set_many(
+                {f"payments:order:{oid}": payments for oid, payments in loaded.items()}, expire=300
+            )
+            by_order.update(loaded)
+        
+        print(f"📦 Batch lookup by order: {len(order_ids) - len(missing)} cached, {len(missing)} from DB")
+        return [payment for oid in order_ids for payment in by_order[oid]]
+    
+    @staticmethod
+    async def get_all_payments(
+        db: AsyncSession,
+        order_id: Optional[int] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        skip: int = 0
+    ) -> Tuple[List[Payment], Optional[str]]:
+        """Страница платежей с фильтрацией и курсор следующей страницы"""
+        query = select(Payment)
+        columns = (Payment.created_at, Payment.id)
         
         if order_id is not None:
-            query = query.filter(Payment.order_id == order_id)
+            query = query.where(Payment.order_id == order_id)
+            columns = (Payment.order_id, Payment.id)
         
-        return query.offset(skip).limit(limit).all()
+        payments = (await db.scalars(paginate(query, columns, cursor, limit).offset(skip))).all()
+        return payments, next_cursor(payments, columns, limit)
+    
+    @staticmethod
+    def export_query(
+        order_id: Optional[int] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None
+    ):
+        """Запрос выгрузки: колонки таблицы без ORM объектов, порядок как у списка"""
+        query = select(*Payment.__table__.columns)
+        columns = (Payment.created_at, Payment.id)
+        if order_id is not None:
+            query = query.where(Payment.order_id == order_id)
+            columns = (Payment.order_id, Payment.id)
+        if created_from is not None:
+            query = query.where(Payment.created_at >= created_from)
+        if created_to is not None:
+            query = query.where(Payment.created_at < created_to)
+        return query.order_by(*columns)
     
     @staticmethod
-    def create_payment(db: Session, payment_data: PaymentCreate) -> Payment:
+    async def create_payment(db: AsyncSession, payment_data: PaymentCreate) -> Payment:
         """
         Создать новый платеж с имитацией обработки
         
@@ -64,15 +150,41 @@ class PaymentService:
             payment.status = PaymentStatus.COMPLETED.value
             print(f"✅ Payment COMPLETED for order {payment.order_id}")
         
-        db.add(payment)
-        db.commit()
-        db.refresh(payment)
+        if group_commit_config.enabled:
+            # Вставка в общей транзакции с конкурентными create_payment
+            payment = await payment_committer.submit(
+                {**payment_data.model_dump(), "status": payment.status}
+            )
+        else:
+            db.add(payment)
+            await db.commit()
+            await db.refresh(payment)
+        
+        # Список платежей заказа изменился
+        await redis_client.delete(f"payments:order:{payment_data.order_id}")
         return payment
     
     @staticmethod
-    def update_payment(db: Session, payment_id: int, payment_data: PaymentUpdate) -> Optional[Payment]:
+    async def create_payments_bulk(db: AsyncSession, rows: List[Tuple[int, PaymentCreate]]) -> Tuple[List[dict], List[dict]]:
+        """Создать платежи пакетом с той же имитацией обработки, что и create_payment"""
+        values = []
+        for index, payment_data in rows:
+            payment_status = PaymentStatus.FAILED if random.random() < 0.3 else PaymentStatus.COMPLETED
+            values.append((index, {**payment_data.model_dump(), "status": payment_status.value}))
+        
+        created, errors = await insert_chunks(db, Payment, values)
+        
+        # Списки платежей заказов изменились (все ключи одной командой DEL)
+        order_ids = {payment["order_id"] for payment in created}
+        if order_ids:
+            await redis_client.delete(*(f"payments:order:{order_id}" for order_id in order_ids))
+        print(f"💳 Bulk payments: {len(created)} created, {len(errors)} failed")
+        return created, errors
+    
+    @staticmethod
+    async def update_payment(db: AsyncSession, payment_id: int, payment_data: PaymentUpdate) -> Optional[Payment]:
         """Обновить статус платежа"""
-        payment = db.query(Payment).filter(Payment.id == payment_id).first()
+        payment = await db.get(Payment, payment_id)
         
         if not payment:
             return None
@@ -81,30 +193,33 @@ class PaymentService:
         for key, value in update_data.items():
             setattr(payment, key, value)
         
-        db.commit()
-        db.refresh(payment)
+        await db.commit()
         
-        # Инвалидируем кэш
-        redis_client.delete(f"payment:{payment_id}")
+        # Инвалидируем кэш (оба ключа одной командой) параллельно с перечитыванием записи
+        await asyncio.gather(
+            db.refresh(payment),
+            redis_client.delete(f"payment:{payment_id}", f"payments:order:{payment.order_id}")
+        )
         print(f"🗑️  Cache invalidated for payment:{payment_id}")
         
         return payment
     
     @staticmethod
-    def delete_payment(db: Session, payment_id: int) -> Optional[Payment]:
+    async def delete_payment(db: AsyncSession, payment_id: int) -> Optional[Payment]:
         """Удалить платеж"""
-        payment = db.query(Payment).filter(Payment.id == payment_id).first()
+        payment = await db.get(Payment, payment_id)
         
         if not payment:
             return None
         
-        db.delete(payment)
-        db.commit()
+        await db.delete(payment)
+        await db.commit()
         
-        redis_client.delete(f"payment:{payment_id}")
+        await redis_client.delete(f"payment:{payment_id}", f"payments:order:{payment.order_id}")
         print(f"🗑️  Cache invalidated for payment:{payment_id}")
         
         return payment
 
 
+payment_committer = GroupCommitter(Payment, group_commit_config)
 payment_service = PaymentService()
@@ -0,0 +1,76 @@
+import json
+import os
+from typing import Any, List, Tuple, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+# Bulk create configuration
+class BulkConfig:
+    def __init__(self):
+        # Максимум строк в одном запросе /bulk
+        self.max_rows = int(os.getenv("BULK_MAX_ROWS", 10000))
+        # Строк в одном INSERT ... RETURNING (и в одной транзакции)
+        self.chunk_size = int(os.getenv("BULK_CHUNK_SIZE", 500))
+
+
+bulk_config = BulkConfig()
+
+
+def validate_rows(rows: List[Any], schema: Type[BaseModel]) -> Tuple[List[Tuple[int, BaseModel]], List[dict]]:
+    """Проверить каждую строку отдельно: (index, модель) для корректных и ошибки по индексам"""
+    if len(rows) > bulk_config.max_rows:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {bulk_config.max_rows} rows per request"
+        )
+    valid, errors = [], []
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, schema.model_validate(row)))
+        except ValidationError as e:
+            errors.append({"index": index, "detail": json.loads(e.json(include_url=False))})
+    return valid, errors
+
+
+async def insert_chunks(db: AsyncSession, model, rows: List[Tuple[int, dict]]) -> Tuple[list, List[dict]]:
+    """
+    Вставка многострочными INSERT ... RETURNING по chunk_size строк
+
+    Каждый кусок - отдельная транзакция. Если она не удалась (ограничение,
+    переполнение типа колонки и т.п.), кусок откатывается и повторяется
+    по строке: ошибку получают только виновные строки, а уже
+    закоммиченные куски всегда попадают в ответ.
+    Созданные строки (колонки таблицы, без ORM объектов) возвращаются
+    в порядке строк запроса.
+    """
+    created, errors = [], []
+    for start in range(0, len(rows), bulk_config.chunk_size):
+        chunk = rows[start:start + bulk_config.chunk_size]
+        try:
+            created.extend(await _insert(db, model, [values for _, values in chunk]))
+            continue
+        except Exception:
+            await db.rollback()
+        for index, values in chunk:
+            try:
+                created.extend(await _insert(db, model, [values]))
+            except Exception as e:
+                await db.rollback()
+                error = getattr(e, "orig", None) or e
+                errors.append({"index": index, "detail": f"{type(error).__name__}: {error}"})
+    return created, errors
+
+
+async def _insert(db: AsyncSession, model, rows: List[dict]) -> list:
+    """Один многострочный INSERT ... RETURNING и коммит"""
+    result = await db.execute(
+        insert(model.__table__).returning(*model.__table__.columns, sort_by_parameter_order=True),
+        rows
+    )
+    items = result.mappings().all()
+    await db.commit()
+    return items
@@ -1,10 +1,15 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from typing import Optional
 
-from .database import init_db
+from .compression import CompressionMiddleware
+from .database import engine, init_db, pool_stats
+from .deadline import DeadlineMiddleware
+from .metrics import CONTENT_TYPE, MetricsMiddleware, registry
 from .routes import users
 from .redis_client import redis_client
+from .tracing import TraceMiddleware, tracer
 
 
 @asynccontextmanager
@@ -13,11 +18,12 @@ async def lifespan(app: FastAPI):
     # Startup
     print("🚀 Initializing Users Service...")
     print("📊 Initializing database...")
-    init_db()
+    await init_db()
     print("✅ Database initialized")
     
     # Проверяем Redis
-    if redis_client.ping():
+    await redis_client.connect()
+    if redis_client.available:
         print("✅ Redis connected - caching enabled")
     else:
         print("⚠️  Redis not available - caching disabled")
@@ -26,6 +32,8 @@ async def lifespan(app: FastAPI):
     
     # Shutdown
     print("👋 Shutting down Users Service...")
+    await engine.dispose()
+    await redis_client.close()
 
 
 # Создаём FastAPI приложение
@@ -45,12 +53,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Сжатие больших ответов по Accept-Encoding
+app.add_middleware(CompressionMiddleware)
+
+# Дедлайн запроса от gateway: просроченные запросы не выполняются
+app.add_middleware(DeadlineMiddleware)
+
+# Гистограмма задержки запросов по маршруту и статусу
+app.add_middleware(
+    MetricsMiddleware,
+    histogram=registry.histogram(
+        "http_request_duration_seconds",
+        "Request latency by route and status",
+        ("method", "route", "status"),
+    ),
+)
+
+# Трассировка: серверный спан на запрос, контекст из traceparent gateway
+app.add_middleware(TraceMiddleware, service_name="service_users")
+
 # Подключаем роуты
 app.include_router(users.router)
 
 
 @app.get("/")
-def root():
+async def root():
     """Root endpoint"""
     return {
         "service": "Users Service",
@@ -60,10 +87,32 @@ def root():
 
 
 @app.get("/health")
-def health():
+async def health():
     """Health check endpoint"""
     return {
         "status": "OK",
         "service": "Users Service",
-        "redis": redis_client.ping()
+        "redis": await redis_client.ping()
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Метрики в формате Prometheus"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
+
+@app.get("/debug/traces")
+async def debug_traces(trace_id: Optional[str] = None, limit: int = 100):
+    """Последние спаны из кольцевого буфера (новые первыми)"""
+    return {
+        "sample_rate": tracer.config.sample_rate,
+        "exported": tracer.exporter.exported,
+        "spans": tracer.exporter.recent(trace_id, limit),
     }
+
+
+@app.get("/debug/db-pool")
+async def debug_db_pool():
+    """Пул соединений БД: занятые, сверх лимита, ожидание и задержка checkout"""
+    return pool_stats()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Index
 from datetime import datetime
 from .database import Base
 
@@ -6,6 +6,10 @@ from .database import Base
 class User(Base):
     """Модель пользователя в базе данных"""
     __tablename__ = "users"
+    __table_args__ = (
+        # Keyset пагинация списка: ORDER BY created_at, id
+        Index("ix_users_created_at_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -1,30 +1,81 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Body, Depends, HTTPException, status, Query, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, List, Optional
+from datetime import datetime
+import os
 
 from ..database import get_db
-from ..schemas import UserCreate, UserUpdate, UserResponse
+from ..pagination import set_next_cursor
+from ..export import export_response
+from ..bulk import validate_rows
+from ..schemas import UserCreate, UserUpdate, UserResponse, UserBulkResponse
 from ..services.user_service import user_service
 from ..models import User
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+# Максимум id в одном пакетном запросе
+MAX_BATCH_IDS = int(os.getenv("BATCH_LOOKUP_MAX_IDS", 100))
+
+
+def parse_ids(values: List[str]) -> List[int]:
+    """ids=1,2,3 и/или ids=1&ids=2 -> [1, 2, 3]"""
+    try:
+        ids = [int(part) for value in values for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="ids must be a comma-separated list of integers"
+        )
+    if len(ids) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=f"At most {MAX_BATCH_IDS} ids per request"
+        )
+    return ids
+
 
 @router.get("", response_model=List[UserResponse])
-def get_users(
+async def get_users(
+    response: Response,
+    ids: Optional[List[str]] = Query(None),
+    cursor: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получить список всех пользователей"""
-    users = user_service.get_all_users(db, skip=skip, limit=limit)
+    """
+    Получить список пользователей или пакет по ids (MGET + один IN запрос)
+
+    Список упорядочен по (created_at, id); курсор следующей страницы
+    возвращается в заголовке X-Next-Cursor. skip оставлен для старых клиентов.
+    """
+    if ids:
+        return await user_service.get_users_by_ids(db, parse_ids(ids))
+    users, next_page = await user_service.get_all_users(db, cursor=cursor, limit=limit, skip=skip)
+    set_next_cursor(response, next_page)
     return users
 
 
+@router.get("/export")
+async def export_users(
+    format: str = "ndjson",
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None
+):
+    """Потоковая выгрузка пользователей (ndjson, csv или arrow) с фильтром по created_at"""
+    return export_response(
+        user_service.export_query(created_from=created_from, created_to=created_to),
+        format,
+        "users"
+    )
+
+
 @router.get("/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
     """Получить пользователя по ID (с кэшированием)"""
-    user = user_service.get_user_by_id(db, user_id)
+    user = await user_service.get_user_by_id(db, user_id)
     
     if not user:
         raise HTTPException(
@@ -36,28 +87,39 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Создать нового пользователя"""
     # Проверка на существующий email
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    user = user_service.create_user(db, user_data)
+    user = await user_service.create_user(db, user_data)
     return user
 
 
+@router.post("/bulk", response_model=UserBulkResponse)
+async def create_users_bulk(rows: List[Any] = Body(...), db: AsyncSession = Depends(get_db)):
+    """
+    Создать пользователей пакетом: каждая строка проверяется отдельно, корректные
+    вставляются многострочными INSERT ... RETURNING. Ошибки - по индексам строк.
+    """
+    valid, errors = validate_rows(rows, UserCreate)
+    created, insert_errors = await user_service.create_users_bulk(db, valid)
+    return {"created": created, "errors": sorted(errors + insert_errors, key=lambda error: error["index"])}
+
+
 @router.put("/{user_id}", response_model=UserResponse)
-def update_user(
+async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить пользователя"""
-    user = user_service.update_user(db, user_id, user_data)
+    user = await user_service.update_user(db, user_id, user_data)
     
     if not user:
         raise HTTPException(
@@ -69,9 +131,9 @@ def update_user(
 
 
 @router.delete("/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
     """Удалить пользователя"""
-    user = user_service.delete_user(db, user_id)
+    user = await user_service.delete_user(db, user_id)
     
     if not user:
         raise HTTPException(
@@ -90,13 +152,13 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
 
 
 @router.get("/status")
-def status():
+async def status_check():
     """Status endpoint"""
     return {"status": "Users service is running"}
 
 
 @router.get("/health")
-def health_check():
+async def health_check():
     """Health check endpoint"""
     return {
         "status": "OK",
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import Any, List, Optional
 
 
 class UserBase(BaseModel):
@@ -27,3 +27,15 @@ class UserResponse(UserBase):
     
     class Config:
         from_attributes = True
+
+
+class BulkError(BaseModel):
+    """Ошибка строки пакетного создания"""
+    index: int
+    detail: Any
+
+
+class UserBulkResponse(BaseModel):
+    """Результат пакетного создания пользователей"""
+    created: List[UserResponse]
+    errors: List[BulkError]
@@ -1,15 +1,29 @@
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional, List, Tuple
+from datetime import datetime
+import asyncio
 from ..models import User
 from ..schemas import UserCreate, UserUpdate
 from ..redis_client import redis_client
+from ..pagination import paginate, next_cursor
+from ..bulk import insert_chunks
 
 
 class UserService:
     """Сервис для работы с пользователями"""
     
     @staticmethod
-    def get_user_by_id(db: Session, user_id: int) -> Optional[dict]:
+    def _user_to_dict(user: User) -> dict:
+        return {
+            "id": user.id,
+            "email": user.email,
+            "name": user.name,
+            "created_at": user.created_at.isoformat()
+        }
+    
+    @staticmethod
+    async def get_user_by_id(db: AsyncSession, user_id: int) -> Optional[dict]:
         """
         Получить пользователя по ID с использованием кэша
         
@@ -21,53 +35,115 @@ class UserService:
         cache_key = f"user:{user_id}"
         
         # 1. Проверяем кэш
-        cached_user = redis_client.get(cache_key)
+        cached_user = await redis_client.get(cache_key)
         if cached_user:
             print(f"✅ Cache HIT for {cache_key}")
             return cached_user
         
         # 2. Запрос в БД
         print(f"❌ Cache MISS for {cache_key}")
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         
         if not user:
             return None
         
         # 3. Преобразуем в dict и сохраняем в кэш
-        user_dict = {
-            "id": user.id,
-            "email": user.email,
-            "name": user.name,
-            "created_at": user.created_at.isoformat()
-        }
+        user_dict = UserService._user_to_dict(user)
         
         # Сохраняем в кэш на 5 минут
-        redis_client.set(cache_key, user_dict, expire=300)
+        await redis_client.set(cache_key, user_dict, expire=300)
         
         return user_dict
     
     @staticmethod
-    def get_all_users(db: Session, skip: int = 0, limit: int = 100) -> List[User]:
-        """Получить список всех пользователей"""
-        return db.query(User).offset(skip).limit(limit).all()
+    async def get_users_by_ids(db: AsyncSession, user_ids: List[int]) -> List[dict]:
+        """
+        Получить несколько пользователей за один проход
+
+        1. Один MGET по всем ключам
+        2. Промахи - одним запросом WHERE id IN (...)
+        3. Загруженные записи кладутся в кэш одним pipeline
+        Порядок - как в user_ids, отсутствующие id пропускаются.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        cached = await redis_client.mget([f"user:{user_id}" for user_id in user_ids])
+        found = {user_id: user for user_id, user in zip(user_ids, cached) if user is not None}
+        
+        missing = [user_id for user_id in user_ids if user_id not in found]
+        if missing:
+            loaded = {
+                user.id: UserService._user_to_dict(user)
+                for user in (await db.scalars(select(User).where(User.id.in_(missing)))).all()
+            }
+            await redis_client.set_many(
+                {f"user:{user_id}": user for user_id, user in loaded.items()}, expire=300
+            )
+            found.update(loaded)
+        
+        print(f"📦 Batch lookup: {len(user_ids) - len(missing)} cached, {len(missing)} from DB")
+        return [found[user_id] for user_id in user_ids if user_id in found]
+    
+    @staticmethod
+    async def get_all_users(
+        db: AsyncSession,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+        skip: int = 0
+    ) -> Tuple[List[User], Optional[str]]:
+        """Страница пользователей и курсор следующей страницы"""
+        columns = (User.created_at, User.id)
+        query = paginate(select(User), columns, cursor, limit)
+        users = (await db.scalars(query.offset(skip))).all()
+        return users, next_cursor(users, columns, limit)
     
     @staticmethod
-    def create_user(db: Session, user_data: UserCreate) -> User:
+    def export_query(created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+        """Запрос выгрузки: колонки таблицы без ORM объектов, порядок (created_at, id)"""
+        query = select(*User.__table__.columns)
+        if created_from is not None:
+            query = query.where(User.created_at >= created_from)
+        if created_to is not None:
+            query = query.where(User.created_at < created_to)
+        return query.order_by(User.created_at, User.id)
+    
+    @staticmethod
+    async def create_user(db: AsyncSession, user_data: UserCreate) -> User:
         """Создать нового пользователя"""
         user = User(**user_data.model_dump())
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        await db.refresh(user)
         return user
     
     @staticmethod
-    def update_user(db: Session, user_id: int, user_data: UserUpdate) -> Optional[User]:
+    async def create_users_bulk(db: AsyncSession, rows: List[Tuple[int, UserCreate]]) -> Tuple[List[dict], List[dict]]:
+        """Создать пользователей пакетом; email, уже занятые или повторённые в пакете, - ошибки строк"""
+        emails = [user_data.email for _, user_data in rows]
+        taken = set()
+        for start in range(0, len(emails), 500):
+            taken.update((await db.scalars(
+                select(User.email).where(User.email.in_(emails[start:start + 500]))
+            )).all())
+        
+        values, errors = [], []
+        for index, user_data in rows:
+            if user_data.email in taken:
+                errors.append({"index": index, "detail": "Email already registered"})
+                continue
+            taken.add(user_data.email)
+            values.append((index, user_data.model_dump()))
+        
+        created, insert_errors = await insert_chunks(db, User, values)
+        return created, errors + insert_errors
+    
+    @staticmethod
+    async def update_user(db: AsyncSession, user_id: int, user_data: UserUpdate) -> Optional[User]:
         """
         Обновить пользователя
         
         Важно: После обновления инвалидируем кэш!
         """
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         
         if not user:
             return None
@@ -77,32 +153,34 @@ class UserService:
         for key, value in update_data.items():
             setattr(user, key, value)
         
-        db.commit()
-        db.refresh(user)
+        await db.commit()
         
-        # Инвалидируем кэш
-        redis_client.delete(f"user:{user_id}")
+        # Инвалидируем кэш параллельно с перечитыванием записи из БД
+        await asyncio.gather(
+            db.refresh(user),
+            redis_client.delete(f"user:{user_id}")
+        )
         print(f"🗑️  Cache invalidated for user:{user_id}")
         
         return user
     
     @staticmethod
-    def delete_user(db: Session, user_id: int) -> Optional[User]:
+    async def delete_user(db: AsyncSession, user_id: int) -> Optional[User]:
         """
         Удалить пользователя
         
         Важно: После удаления инвалидируем кэш!
         """
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         
         if not user:
             return None
         
-        db.delete(user)
-        db.commit()
+        await db.delete(user)
+        await db.commit()
         
         # Инвалидируем кэш
-        redis_client.delete(f"user:{user_id}")
+        await redis_client.delete(f"user:{user_id}")
         print(f"🗑️  Cache invalidated for user:{user_id}")
         
         return user